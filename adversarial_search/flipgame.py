@@ -1,5 +1,13 @@
+import dbm
+import itertools
+import multiprocessing
+import os
 import random
-from anytree import Node, RenderTree
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from anytree import Node
 
 # by Kacper Pach s27112 & Dawid Frontczak s29608
 # rules & environment setup in readme (https://github.com/dawiffi/NAI_pjatk7sem/blob/main/adversarial_search/README.md)
@@ -11,6 +19,52 @@ MAX_BOARD_SIZE = 12
 # minimal amout of "++" occurrences for the board to be considered playable
 # this is so we don't generate game boards that are solved before the game begins
 MINIMAL_DOUBLE_SIGHN_OCCURANCE = 3 
+# set to True to print the tree of positions reachable from the board before the ai moves,
+# labelled with who wins them under perfect play (exact values, whatever AI_ENGINE is)
+VISUALISE_AI_THINKING = False
+# how many moves ahead the visualisation goes
+VISUALISE_MAX_DEPTH = 4
+# show only this many best moves of every position, None shows all of them
+VISUALISE_TOP_K = None
+# set to True to only show the best line of play instead of the whole tree
+VISUALISE_PRINCIPAL_VARIATION = False
+# file the visualisation is appended to, None prints it to the console
+VISUALISE_OUTPUT = None
+
+# engine ai_turn uses to pick its move, one of AI_ENGINES
+AI_ENGINE = 'grundy'
+
+# transposition table shared between ai turns
+# maps a canonical bitboard (see canonical_bits) to 1 if the player to move wins, -1 if they lose
+SOLVED_POSITIONS = {}
+
+# file the solved positions and ai moves are kept in between games, None turns it off
+POSITION_BOOK_PATH = 'flipgame_book'
+# the opened position book, see open_position_book
+POSITION_BOOK = None
+# amount of SOLVED_POSITIONS entries already written to the position book
+BOOK_SYNCED_POSITIONS = 0
+
+# amount of positions expanded by the searches, used for benchmarking
+SEARCH_STATS = {'nodes': 0}
+
+# wall clock time the 'iterative' engine may spend on a single move, in seconds
+AI_TIME_BUDGET = 0.2
+# amount of processes the 'parallel' engine splits the root moves between, 1 searches serially
+AI_WORKERS = os.cpu_count() or 1
+# worker processes of the 'parallel' engine, kept between ai turns, see get_parallel_pool
+PARALLEL_POOL = None
+# set in the worker processes, root solves give up once the event is set
+SEARCH_CANCELLED = None
+# how many positions a worker expands between checks of SEARCH_CANCELLED
+CANCEL_CHECK_INTERVAL = 1024
+
+# grundy numbers of a single run of "+" repeat with period 34 from this run length on
+# (the game is Dawson's Kayles, octal game 0.07) so the table never grows past it
+GRUNDY_PERIOD = 34
+GRUNDY_PERIOD_START = 87
+# cached grundy numbers indexed by the length of a run of "+"
+GRUNDY_NUMBERS = [0, 0]
 
 def generate_possible_next_moves(s: str) -> list:
     """
@@ -76,20 +130,24 @@ def get_player_move(possible_moves: list) -> str:
         else:
             print("Invalid move.") 
 
-def create_next_branches(parent: Node):
+def create_next_branches(parent: Node, max_depth: int = MAX_SEARCH_DEPTH):
     '''
     calculates and appends next branches of a node containing a board state
     the function will run until there is no more possible moves or the 
-    MAX_SEARCH_DEPTH is exceed.
+    max_depth is exceed.
 
     Args:
         parent (Node): Node containing a board state that will be analised for next possible moves
+        max_depth (int): depth after which branches are no longer generated
     Returns:
         int: score of the branch needed for ai to make the final decision 
     '''
-    parent_board = parent.name
-    next_moves = generate_possible_next_moves(parent_board)
-    if not next_moves or parent.depth > MAX_SEARCH_DEPTH:
+    parent_bits = getattr(parent, 'bits', None)
+    if parent_bits is None:
+        parent_bits = board_to_bits(parent.name)
+    next_moves = generate_possible_next_bits(parent_bits)
+    SEARCH_STATS['nodes'] += 1
+    if not next_moves or parent.depth > max_depth:
         parent.is_last_child = True
         if parent.depth % 2 == 0: # player wins on even ai wins on odd 
             return -5 
@@ -98,27 +156,550 @@ def create_next_branches(parent: Node):
     else:
         branch_value = 0 #branch_value is the sum of its children values 
         for move in next_moves:
-            new_child = Node(move, parent=parent, depth=parent.depth+1, is_last_child=False, score=0)
-            branch_value += create_next_branches(new_child)
+            new_child = Node(bits_to_board(move, len(parent.name)), parent=parent, bits=move, depth=parent.depth+1, is_last_child=False, score=0)
+            branch_value += create_next_branches(new_child, max_depth)
         parent.score = branch_value
     return parent.score
 
-def visualise_node_data(parent: Node):
+def find_tree_move(board_state: str, max_depth: int = MAX_SEARCH_DEPTH) -> str:
+    '''
+    Picks the move with the highest create_next_branches score.
+
+    Args:
+        board_state (str): current board state
+        max_depth (int): depth after which branches are no longer generated
+    Returns:
+        str: board state after the chosen move
+    '''
+    origial = Node(board_state, depth=0, is_last_child=False)
+    create_next_branches(origial, max_depth)
+
+    #select move with the highest score 
+    favorite_child = origial.children[0]
+    for potential_child in origial.children:
+        if potential_child.score > favorite_child.score:
+            favorite_child = potential_child
+    return favorite_child.name
+
+def board_to_bits(board_state: str) -> int:
+    '''
+    Converts a board to its bitboard, bit i is set when the i-th char is "+".
+
+    Args:
+        board_state (str): board state e.g. "++--+-++-"
+    Returns:
+        int: bitboard of the board e.g. 0b011010011
+    '''
+    if not board_state:
+        return 0
+    return int(board_state[::-1].replace('+', '1').replace('-', '0'), 2)
+
+def bits_to_board(bits: int, length: int) -> str:
+    '''
+    Converts a bitboard back to the string form used by the player and the renderer.
+
+    Args:
+        bits (int): bitboard, bit i set when the i-th char is "+"
+        length (int): length of the board
+    Returns:
+        str: board state e.g. "++--+-++-"
+    '''
+    return format(bits, f'0{length}b')[::-1].replace('1', '+').replace('0', '-')
+
+def generate_possible_next_bits(bits: int) -> list:
+    '''
+    Bitboard version of generate_possible_next_moves. 
+    Bit i of bits & (bits >> 1) is set when chars i and i + 1 are both "+",
+    and each move is made by flipping those two bits with a xor.
+
+    Args:
+        bits (int): bitboard of the current board state
+    Returns:
+        list: bitboards after every valid move, in the same order as generate_possible_next_moves
+    '''
+    result = []
+    moves = bits & (bits >> 1)
+    while moves:
+        lowest = moves & -moves
+        result.append(bits ^ (lowest | lowest << 1))
+        moves ^= lowest
+    return result
+
+def canonical_bits(bits: int) -> int:
+    '''
+    Reduces a bitboard to a key shared by all boards with the same outcome.
+    Only runs of "+" long enough to hold a move matter and their order on the
+    board does not, so the key is made of those runs sorted by length.
+
+    Args:
+        bits (int): bitboard of the board
+    Returns:
+        int: canonical bitboard e.g. 0b11101 for "++-+++"
+    '''
+    runs = sorted(map(len, format(bits, 'b').split('0')))
+    key = 0
+    for run in runs:
+        if run > 1:
+            key = (key << (run + 1)) | ((1 << run) - 1)
+    return key
+
+def negamax(bits: int, alpha: int = -1, beta: int = 1) -> int:
+    '''
+    Solves the board for the player that is about to move.
+    Positions are memoized in SOLVED_POSITIONS so boards reached through 
+    different move orders are only searched once, and the search of a position
+    stops as soon as one winning move is found (alpha-beta cutoff).
+
+    Args:
+        bits (int): bitboard of the current board state
+        alpha (int): lowest value the player to move is already guaranteed
+        beta (int): highest value the opponent will allow
+    Returns:
+        int: 1 if the player to move wins with perfect play, -1 otherwise
+    '''
+    key = canonical_bits(bits)
+    if key in SOLVED_POSITIONS:
+        return SOLVED_POSITIONS[key]
+
+    SEARCH_STATS['nodes'] += 1
+    if SEARCH_CANCELLED is not None and SEARCH_STATS['nodes'] % CANCEL_CHECK_INTERVAL == 0 and SEARCH_CANCELLED.is_set():
+        raise SearchCancelled()
+    value = -1 # player that can't move loses
+    for move in generate_possible_next_bits(key):
+        value = max(value, -negamax(move, -beta, -alpha))
+        alpha = max(alpha, value)
+        if alpha >= beta:
+            break
+    SOLVED_POSITIONS[key] = value
+    return value
+
+def find_best_move(board_state: str) -> str:
+    '''
+    Picks a move that leaves the opponent in a lost position.
+    If there is none the game is lost anyway and the first move is taken.
+
+    Args:
+        board_state (str): current board state
+    Returns:
+        str: board state after the chosen move
+    '''
+    possible_moves = generate_possible_next_bits(board_to_bits(board_state))
+    for move in possible_moves:
+        if negamax(move) == -1:
+            return bits_to_board(move, len(board_state))
+    return bits_to_board(possible_moves[0], len(board_state))
+
+class SearchCancelled(Exception):
+    '''
+    Raised inside a worker of the 'parallel' engine once another root move already won.
+    '''
+
+def init_parallel_worker(cancelled):
+    '''
+    Runs once in every worker process of the 'parallel' engine.
+
+    Args:
+        cancelled: multiprocessing event set when the remaining root solves are no longer needed
+    '''
+    global SEARCH_CANCELLED
+    SEARCH_CANCELLED = cancelled
+
+def get_parallel_pool(workers: int) -> tuple:
+    '''
+    Returns the worker pool of the 'parallel' engine, creating it on first use.
+    The pool is reused between ai turns, so the processes (and the positions they
+    solved) survive, it's only recreated when the amount of workers changes.
+
+    Args:
+        workers (int): amount of worker processes
+    Returns:
+        tuple: (executor, cancel event shared with the workers)
+    '''
+    global PARALLEL_POOL
+    if PARALLEL_POOL is not None and PARALLEL_POOL[0] != workers:
+        close_parallel_pool()
+    if PARALLEL_POOL is None:
+        cancelled = multiprocessing.Event()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_parallel_worker, initargs=(cancelled,))
+        PARALLEL_POOL = (workers, executor, cancelled)
+    return PARALLEL_POOL[1], PARALLEL_POOL[2]
+
+def close_parallel_pool():
+    '''
+    Stops the worker processes of the 'parallel' engine, the next parallel search starts new ones.
+    '''
+    global PARALLEL_POOL
+    if PARALLEL_POOL is not None:
+        PARALLEL_POOL[1].shutdown(cancel_futures=True)
+        PARALLEL_POOL = None
+
+def solve_root_move(bits: int) -> tuple:
+    '''
+    Worker of find_parallel_move, solves a single root move in its own process.
+
+    Args:
+        bits (int): bitboard after the root move
+    Returns:
+        tuple: (bits, value of the position for the opponent, positions solved by this call, amount of nodes it searched)
+    '''
+    # the worker's table also holds what it inherited and solved for earlier tasks, only the new entries are sent back
+    solved_before = len(SOLVED_POSITIONS)
+    nodes_before = SEARCH_STATS['nodes']
+    value = negamax(bits)
+    solved = dict(itertools.islice(SOLVED_POSITIONS.items(), solved_before, None))
+    return bits, value, solved, SEARCH_STATS['nodes'] - nodes_before
+
+def find_parallel_move(board_state: str, workers: int = AI_WORKERS) -> str:
+    '''
+    Picks the same kind of move as find_best_move, but every root move is solved
+    in a separate process of a pool kept between turns. Tables solved by the workers
+    are merged back into SOLVED_POSITIONS. Once a winning move shows up the queued
+    solves are cancelled and the running ones stop, so nothing keeps running in the background.
+    The move picked may differ between runs, use workers=1 for a deterministic serial search.
+
+    Args:
+        board_state (str): current board state
+        workers (int): amount of worker processes
+    Returns:
+        str: board state after the chosen move
+    '''
+    if workers <= 1:
+        return find_best_move(board_state)
+
+    # root moves leading to the same canonical board only need to be solved once
+    root_moves = {}
+    for move in generate_possible_next_bits(board_to_bits(board_state)):
+        root_moves.setdefault(canonical_bits(move), move)
+    best_move = next(iter(root_moves.values()))
+
+    unsolved_moves = []
+    for key, move in root_moves.items():
+        if SOLVED_POSITIONS.get(key) == -1:
+            return bits_to_board(move, len(board_state))
+        if key not in SOLVED_POSITIONS:
+            unsolved_moves.append(move)
+
+    executor, cancelled = get_parallel_pool(workers)
+    cancelled.clear()
+    futures = [executor.submit(solve_root_move, move) for move in unsolved_moves]
+    try:
+        for future in as_completed(futures):
+            move, value, solved, nodes = future.result()
+            SOLVED_POSITIONS.update(solved)
+            SEARCH_STATS['nodes'] += nodes
+            if value == -1:
+                best_move = move
+                break
+    finally:
+        # stop the solves still running and wait for them, so they don't compete with the next search
+        cancelled.set()
+        for future in futures:
+            future.cancel()
+        wait(futures)
+    return bits_to_board(best_move, len(board_state))
+
+class SearchTimeout(Exception):
+    '''
+    Raised inside the depth limited search once its time budget runs out.
+    '''
+
+def depth_limited_negamax(bits: int, depth: int, deadline: float, best_replies: dict) -> int:
+    '''
+    Negamax that gives up on positions deeper than depth moves.
+    Only exact results are stored in SOLVED_POSITIONS, so positions left
+    unsolved at this depth get searched again by the next iteration.
+
+    Args:
+        bits (int): bitboard of the current board state
+        depth (int): amount of moves that may still be searched
+        deadline (float): time.perf_counter() value the search must end by
+        best_replies (dict): move that was best in each position during previous iterations,
+            it is tried first and updated with the result of this one
+    Returns:
+        int: 1 if the player to move wins, -1 if they lose, 0 if it is not known at this depth
+    Raises:
+        SearchTimeout: when the deadline passes
+    '''
+    key = canonical_bits(bits)
+    if key in SOLVED_POSITIONS:
+        return SOLVED_POSITIONS[key]
+    if time.perf_counter() > deadline:
+        raise SearchTimeout()
+
+    SEARCH_STATS['nodes'] += 1
+    next_moves = generate_possible_next_bits(key)
+    if not next_moves:
+        SOLVED_POSITIONS[key] = -1
+        return -1
+    if depth == 0:
+        return 0
+
+    if key in best_replies:
+        next_moves.sort(key=lambda move: move != best_replies[key])
+
+    value = -2
+    for move in next_moves:
+        move_value = -depth_limited_negamax(move, depth - 1, deadline, best_replies)
+        if move_value > value:
+            value = move_value
+            best_replies[key] = move
+        if value == 1:
+            break
+    if value != 0:
+        SOLVED_POSITIONS[key] = value
+    return value
+
+def iterative_deepening(board_state: str, time_budget: float = AI_TIME_BUDGET) -> tuple:
+    '''
+    Searches one move deeper at a time until the board is solved or the time 
+    budget runs out, and keeps the best move of the deepest finished iteration.
+    Root moves are ordered by the scores of the previous iteration.
+
+    Args:
+        board_state (str): current board state
+        time_budget (float): wall clock time the search may take, in seconds
+    Returns:
+        tuple: (board state after the chosen move, amount of moves searched ahead)
+    '''
+    deadline = time.perf_counter() + time_budget
+    possible_moves = generate_possible_next_bits(board_to_bits(board_state))
+    # values of the moves for the opponent, so lower is better for us
+    scores = {move: 0 for move in possible_moves}
+    best_replies = {}
+    best_move = possible_moves[0]
+    depth = 0
+    while True:
+        iteration_scores = {}
+        try:
+            for move in sorted(possible_moves, key=scores.get):
+                iteration_scores[move] = depth_limited_negamax(move, depth, deadline, best_replies)
+                if iteration_scores[move] == -1:
+                    break # winning move, no need to look further
+        except SearchTimeout:
+            break
+
+        scores.update(iteration_scores)
+        best_move = min(iteration_scores, key=iteration_scores.get)
+        depth += 1
+        if scores[best_move] == -1 or 0 not in scores.values():
+            break # solved
+    return bits_to_board(best_move, len(board_state)), depth
+
+def find_iterative_move(board_state: str) -> str:
+    '''
+    Picks a move with iterative_deepening within AI_TIME_BUDGET.
+
+    Args:
+        board_state (str): current board state
+    Returns:
+        str: board state after the chosen move
+    '''
+    move, depth = iterative_deepening(board_state, AI_TIME_BUDGET)
+    print(f"Ai searched {depth} moves ahead")
+    return move
+
+def grundy_number(run_length: int) -> int:
     '''
-    visualises all the generated branches of the given node 
+    Returns the grundy number of a board that is a single run of "+".
+    Flipping "++" inside a run of n splits it into runs of i and n - 2 - i,
+    so the number is the mex of grundy(i) ^ grundy(n - 2 - i) over all i.
 
     Args:
-        parent (Node): the parent node we want to display all children of 
+        run_length (int): amount of consecutive "+" chars
+    Returns:
+        int: grundy number of the run
+    '''
+    if run_length >= GRUNDY_PERIOD_START:
+        run_length = GRUNDY_PERIOD_START - GRUNDY_PERIOD + (run_length - GRUNDY_PERIOD_START) % GRUNDY_PERIOD
+
+    while len(GRUNDY_NUMBERS) <= run_length:
+        n = len(GRUNDY_NUMBERS)
+        reachable = {GRUNDY_NUMBERS[i] ^ GRUNDY_NUMBERS[n - 2 - i] for i in range(n - 1)}
+        mex = 0
+        while mex in reachable:
+            mex += 1
+        GRUNDY_NUMBERS.append(mex)
+    return GRUNDY_NUMBERS[run_length]
+
+def find_runs(board_state: str) -> list:
     '''
-    for pre, fill, node in RenderTree(parent):
-        if node.is_last_child:
-            if node.depth % 2 == 0:
-                print("%s\033[91m%s\033[00m" % (pre, node.name)) # player wins on even turns so we print it red
+    Splits the board into its independent subgames, the runs of "+" that 
+    still have room for a move.
+
+    Args:
+        board_state (str): current board state
+    Returns:
+        list: (start index, length) tuples of every run of two or more "+"
+    '''
+    return [(run.start(), len(run.group())) for run in re.finditer(r'\+{2,}', board_state)]
+
+def find_grundy_move(board_state: str) -> str:
+    '''
+    Picks a provably optimal move using the Sprague-Grundy theorem.
+    The board is a sum of its runs, so its grundy number is the xor of the 
+    runs grundy numbers and a winning move brings that xor down to 0.
+    Takes time linear in the board length.
+
+    Args:
+        board_state (str): current board state
+    Returns:
+        str: board state after the chosen move
+    '''
+    runs = find_runs(board_state)
+    total = 0
+    for _, length in runs:
+        total ^= grundy_number(length)
+
+    if total:
+        for start, length in runs:
+            target = total ^ grundy_number(length)
+            if target > grundy_number(length):
+                continue # no move inside this run reaches the target
+            for i in range(length - 1):
+                if grundy_number(i) ^ grundy_number(length - 2 - i) == target:
+                    move = start + i
+                    return board_state[:move] + '--' + board_state[move + 2:]
+
+    # lost position, every move is as good as any other
+    move = runs[0][0]
+    return board_state[:move] + '--' + board_state[move + 2:]
+
+AI_ENGINES = {
+    'tree': find_tree_move,
+    'negamax': find_best_move,
+    'grundy': find_grundy_move,
+    'iterative': find_iterative_move,
+    'parallel': find_parallel_move,
+}
+
+def grundy_value(board_state: str) -> int:
+    '''
+    Returns the grundy number of the whole board, the player to move wins when it's not 0.
+
+    Args:
+        board_state (str): current board state
+    Returns:
+        int: xor of the grundy numbers of all runs of "+"
+    '''
+    total = 0
+    for _, length in find_runs(board_state):
+        total ^= grundy_number(length)
+    return total
+
+def iter_search_tree(board_state: str, max_depth: int = VISUALISE_MAX_DEPTH, top_k: int = None, principal_variation: bool = False):
+    '''
+    Lazily walks the positions reachable from the board, depth first.
+    Only the path to the current position is kept in memory, so the tree is
+    never built as a whole. Moves are ordered best first for the player to move.
+
+    Args:
+        board_state (str): board the walk starts from, the ai is to move there
+        max_depth (int): how many moves ahead to go
+        top_k (int): only follow this many best moves of every position, None follows all
+        principal_variation (bool): only follow the best move of every position
+    Yields:
+        tuple: (tree prefix, board state, depth, True if the player to move wins)
+    '''
+    if principal_variation:
+        top_k = 1
+
+    # board, depth, prefix of the board, prefix of its children
+    stack = [(board_state, 0, '', '')]
+    while stack:
+        board, depth, pre, children_pre = stack.pop()
+        yield pre, board, depth, grundy_value(board) != 0
+        if depth >= max_depth:
+            continue
+
+        # moves that leave the opponent in a lost position go first
+        children = sorted(generate_possible_next_moves(board), key=lambda child: grundy_value(child) == 0, reverse=True)
+        if top_k is not None:
+            children = children[:top_k]
+        for i in reversed(range(len(children))):
+            last = i == len(children) - 1
+            stack.append((
+                children[i], depth + 1,
+                children_pre + ('└── ' if last else '├── '),
+                children_pre + ('    ' if last else '│   '),
+            ))
+
+def stream_visualisation(board_state: str, file=None, max_depth: int = VISUALISE_MAX_DEPTH, top_k: int = None, principal_variation: bool = False):
+    '''
+    Prints the positions from iter_search_tree as they are generated as a tree.
+    Every position is labelled with who wins it under perfect play, finished
+    games are printed red when the player wins and green when the ai wins.
+
+    Args:
+        board_state (str): board the ai is about to move on
+        file: file object the tree is written to, the console by default
+        max_depth (int): how many moves ahead to go
+        top_k (int): only show this many best moves of every position, None shows all
+        principal_variation (bool): only show the best line of play
+    '''
+    file = file or sys.stdout
+    for pre, board, depth, to_move_wins in iter_search_tree(board_state, max_depth, top_k, principal_variation):
+        ai_wins = to_move_wins == (depth % 2 == 0) # ai moves on even depths
+        if '++' not in board:
+            if ai_wins:
+                print("%s\033[92m%s\033[00m" % (pre, board), file=file)
             else:
-                print("%s\033[92m%s\033[00m" % (pre, node.name)) # ai wins on odd turns so we print green
+                print("%s\033[91m%s\033[00m" % (pre, board), file=file)
         else:
-            print("%s%s %s" % (pre, node.name, node.score))
+            print("%s%s %s" % (pre, board, "ai wins" if ai_wins else "player wins"), file=file)
 
+def open_position_book(path: str = POSITION_BOOK_PATH):
+    '''
+    Opens the on-disk position book, creating it if needed, and loads the
+    positions solved in previous games into SOLVED_POSITIONS.
+    The book holds "v<canonical bitboard in hex>" -> value of the position
+    and "m<board state>" -> the move the ai made on that board.
+
+    Args:
+        path (str): path of the book file
+    Returns:
+        the opened dbm database, close it when the game ends
+    '''
+    global BOOK_SYNCED_POSITIONS
+    book = dbm.open(path, 'c')
+    for key in book.keys():
+        if key.startswith(b'v'):
+            SOLVED_POSITIONS[int(key[1:], 16)] = int(book[key])
+    BOOK_SYNCED_POSITIONS = len(SOLVED_POSITIONS)
+    return book
+
+def lookup_book_move(book, board_state: str):
+    '''
+    Returns the move stored in the book for this board.
+
+    Args:
+        book: position book from open_position_book
+        board_state (str): current board state
+    Returns:
+        str: board state after the stored move, None if the board is not in the book
+    '''
+    move = book.get('m' + board_state)
+    return move.decode() if move is not None else None
+
+def update_position_book(book, board_state: str, move: str):
+    '''
+    Writes positions solved since the last update to the book, together with
+    the move made on this board if it's proven to be optimal.
+
+    Args:
+        book: position book from open_position_book
+        board_state (str): board the ai moved on
+        move (str): board state after the ai move
+    '''
+    global BOOK_SYNCED_POSITIONS
+    if len(SOLVED_POSITIONS) < BOOK_SYNCED_POSITIONS:
+        BOOK_SYNCED_POSITIONS = 0 # the table was cleared, write it again
+    for key, value in itertools.islice(SOLVED_POSITIONS.items(), BOOK_SYNCED_POSITIONS, None):
+        book['v%x' % key] = str(value)
+    BOOK_SYNCED_POSITIONS = len(SOLVED_POSITIONS)
+
+    # the move is optimal if it wins, or if every move loses anyway
+    if grundy_value(move) == 0 or grundy_value(board_state) == 0:
+        book['m' + board_state] = move
 
 def player_turn(board_state: str) -> str:
     '''
@@ -145,20 +726,26 @@ def ai_turn(board_state: str) -> str:
     Returns:
         str: board state after ai turn 
     '''
-    # ai turn 
-    origial = Node(board_state, depth=0, is_last_child=False)
-    create_next_branches(origial)
-    visualise_node_data(origial) #uncomment this to see visualisation of how the ai thinks
+    # the tree is only walked when we want to see it, the search itself doesn't need it
+    if VISUALISE_AI_THINKING:
+        if VISUALISE_OUTPUT:
+            with open(VISUALISE_OUTPUT, 'a', encoding='utf-8') as file:
+                stream_visualisation(board_state, file, VISUALISE_MAX_DEPTH, VISUALISE_TOP_K, VISUALISE_PRINCIPAL_VARIATION)
+        else:
+            stream_visualisation(board_state, None, VISUALISE_MAX_DEPTH, VISUALISE_TOP_K, VISUALISE_PRINCIPAL_VARIATION)
 
-    #select move with the highest score 
-    favorite_child = origial.children[0]
-    for potential_child in origial.children:
-        if potential_child.score > favorite_child.score:
-            favorite_child = potential_child
+    # ai turn, boards seen in previous games are answered straight from the book
+    favorite_child = None
+    if POSITION_BOOK is not None:
+        favorite_child = lookup_book_move(POSITION_BOOK, board_state)
+    if favorite_child is None:
+        favorite_child = AI_ENGINES[AI_ENGINE](board_state)
+        if POSITION_BOOK is not None:
+            update_position_book(POSITION_BOOK, board_state, favorite_child)
     
     #return move
-    print(f"Ai moved: {favorite_child.name}")
-    return favorite_child.name
+    print(f"Ai moved: {favorite_child}")
+    return favorite_child
 
 def check_win(win_text: str) -> bool:
     '''
@@ -178,6 +765,8 @@ def check_win(win_text: str) -> bool:
     return False
 
 if __name__ == "__main__":
+    if POSITION_BOOK_PATH:
+        POSITION_BOOK = open_position_book(POSITION_BOOK_PATH)
     board_state = generate_board(MAX_BOARD_SIZE)
 
     while True:
@@ -190,3 +779,6 @@ if __name__ == "__main__":
             break
 
     print("Game over.")
+    close_parallel_pool()
+    if POSITION_BOOK is not None:
+        POSITION_BOOK.close()
@@ -0,0 +1,141 @@
+import argparse
+import itertools
+import random
+import statistics
+import time
+from functools import partial
+
+import flipgame
+
+# by Kacper Pach s27112 & Dawid Frontczak s29608
+# headless self-play benchmark of the flip game ai engines, usage in readme
+
+def make_engine(spec: str):
+    '''
+    Builds an ai engine from its description.
+    The description is an engine name from flipgame.AI_ENGINES optionally followed
+    by its settings e.g. "tree:depth=4", "iterative:budget=0.05", "parallel:workers=4".
+
+    Args:
+        spec (str): engine description
+    Returns:
+        callable: function taking a board state and returning the board after the engine's move
+    '''
+    name, _, options = spec.partition(':')
+    settings = dict(option.split('=', 1) for option in options.split(',') if option)
+
+    if name == 'tree':
+        engine = partial(flipgame.find_tree_move, max_depth=int(settings.pop('depth', flipgame.MAX_SEARCH_DEPTH)))
+    elif name == 'iterative':
+        budget = float(settings.pop('budget', flipgame.AI_TIME_BUDGET))
+        engine = lambda board_state: flipgame.iterative_deepening(board_state, budget)[0]
+    elif name == 'parallel':
+        engine = partial(flipgame.find_parallel_move, workers=int(settings.pop('workers', flipgame.AI_WORKERS)))
+    elif name in flipgame.AI_ENGINES:
+        engine = flipgame.AI_ENGINES[name]
+    else:
+        raise ValueError(f"Unknown engine: {name}")
+    if settings:
+        raise ValueError(f"Unknown settings for {name}: {', '.join(settings)}")
+    return engine
+
+def play_game(board_state: str, players: list, results: dict, tables: dict, cold: bool = False) -> str:
+    '''
+    Plays a single game between two engines, the first one moves first.
+    Every engine searches with its own transposition table, so it never gets
+    positions solved by its opponent for free.
+
+    Args:
+        board_state (str): starting board
+        players (list): two (name, engine) tuples
+        results (dict): per engine statistics the latencies and searched nodes are added to
+        tables (dict): transposition table of every engine, keyed by its name
+        cold (bool): clear the transposition table (and the parallel workers) before every move
+    Returns:
+        str: name of the winning engine
+    '''
+    shared_table = flipgame.SOLVED_POSITIONS
+    turn = 0
+    try:
+        while '++' in board_state:
+            name, engine = players[turn]
+            flipgame.SOLVED_POSITIONS = tables[name]
+            if cold:
+                flipgame.SOLVED_POSITIONS.clear()
+                flipgame.close_parallel_pool()
+            nodes = flipgame.SEARCH_STATS['nodes']
+            start = time.perf_counter()
+            board_state = engine(board_state)
+            results[name]['latencies'].append(time.perf_counter() - start)
+            results[name]['nodes'] += flipgame.SEARCH_STATS['nodes'] - nodes
+            turn = 1 - turn
+    finally:
+        flipgame.SOLVED_POSITIONS = shared_table
+    # player that can't move loses
+    return players[1 - turn][0]
+
+def run_tournament(specs: list, games: int, board_size: int, seed: int, cold: bool = False) -> dict:
+    '''
+    Plays every pair of engines against each other on the same seeded boards.
+    Every board is played twice so both engines get to move first.
+
+    Args:
+        specs (list): engine descriptions, see make_engine
+        games (int): amount of boards per pair of engines
+        board_size (int): length of the boards
+        seed (int): seed of the board generator
+        cold (bool): clear the transposition table before every move
+    Returns:
+        dict: statistics of every engine, keyed by its description
+    '''
+    engines = {spec: make_engine(spec) for spec in specs}
+    results = {spec: {'games': 0, 'wins': 0, 'nodes': 0, 'latencies': []} for spec in specs}
+    tables = {spec: {} for spec in specs}
+
+    random.seed(seed)
+    boards = [flipgame.generate_board(board_size) for _ in range(games)]
+
+    for first, second in itertools.combinations(specs, 2):
+        for board_state in boards:
+            for players in ([first, second], [second, first]):
+                winner = play_game(board_state, [(name, engines[name]) for name in players], results, tables, cold)
+                results[winner]['wins'] += 1
+                for name in players:
+                    results[name]['games'] += 1
+    return results
+
+def print_report(results: dict):
+    '''
+    Prints win rate, searched nodes per second and move latency percentiles of every engine.
+
+    Args:
+        results (dict): statistics returned by run_tournament
+    '''
+    print(f"{'engine':<24}{'games':>7}{'win %':>8}{'moves':>8}{'nodes/s':>12}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        latencies = stats['latencies']
+        total_time = sum(latencies)
+        win_rate = 100 * stats['wins'] / stats['games'] if stats['games'] else 0
+        nodes_per_second = f"{stats['nodes'] / total_time:.0f}" if stats['nodes'] and total_time else '-'
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+            p50, p90, p99 = (1000 * percentiles[i] for i in (49, 89, 98))
+        else:
+            p50 = p90 = p99 = 1000 * latencies[0] if latencies else 0
+        print(f"{name:<24}{stats['games']:>7}{win_rate:>8.1f}{len(latencies):>8}{nodes_per_second:>12}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plays flip game ai engines against each other and benchmarks them.")
+    parser.add_argument('engines', nargs='+', help='engines to compare e.g. grundy tree:depth=4 iterative:budget=0.05')
+    parser.add_argument('--games', type=int, default=100, help='amount of boards every pair of engines plays on')
+    parser.add_argument('--size', type=int, default=flipgame.MAX_BOARD_SIZE, help='length of the boards')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the board generator')
+    parser.add_argument('--cold', action='store_true', help='clear the transposition table before every move')
+    args = parser.parse_args()
+
+    if len(args.engines) < 2:
+        parser.error("at least two engines are needed")
+    try:
+        print_report(run_tournament(args.engines, args.games, args.size, args.seed, args.cold))
+    finally:
+        flipgame.close_parallel_pool()
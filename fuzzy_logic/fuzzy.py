@@ -1,14 +1,31 @@
+import argparse
+import bisect
+import functools
+import itertools
+import socket
+import sys
+import time
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
-import pygame_widgets
-import pygame
-from pygame_widgets.slider import Slider
-from pygame_widgets.textbox import TextBox
+from skfuzzy.control.term import TermAggregate
 
 # by Kacper Pach s27112 & Dawid Frontczak s29608
 # rules & environment setup in readme (https://github.com/dawiffi/NAI_pjatk7sem/blob/main/adversarial_search/README.md)
 
+# grid spacing of every input used by compileFuzzyFan, the error this gives is listed in the readme
+COMPILE_STEPS = {"temp": 1, "load": 2, "tdp": 4}
+# amount of samples computeFanSpeedBatch evaluates at once, bounds its memory use
+BATCH_CHUNK_SIZE = 65536
+# CachedFuzzyFan rounds every input to a multiple of its resolution
+CACHE_RESOLUTION = {"temp": 0.5, "load": 1, "tdp": 1}
+# amount of outputs CachedFuzzyFan keeps
+CACHE_SIZE = 4096
+# smallest change of any input that makes the headless daemon compute the fan speed again
+DAEMON_THRESHOLD = 0.5
+# order of the values in a line of sensor readings read by the daemon
+DAEMON_INPUTS = ("temp", "load", "tdp")
+
 ## Fuzzification
 def getFuzzyFan():
     """
@@ -83,28 +100,568 @@ def getFuzzyFan():
     fan_ctrl = ctrl.ControlSystem([rule1, rule2, rule3, rule4, rule5, rule6, rule7, rule8, rule9, rule10])
     return ctrl.ControlSystemSimulation(fan_ctrl)
 
-"""
-Fuzzy Fan Control System GUI Demonstrator.
-
-This script implements an interactive graphical user interface (GUI) using the
-Pygame library to visualize and test the 'getFuzzyFan' fuzzy logic controller.
-The user can manipulate the input variables (temperature, load, and TDP) via
-sliders, and the GUI dynamically displays the calculated fan speed output based
-on the fuzzy inference system's rules.
-
-Dependencies:
-    - numpy
-    - scikit-fuzzy (skfuzzy)
-    - Pygame
-    - pygame_widgets 
-"""
-if __name__ == "__main__":
-    fan = getFuzzyFan()
+
+def computeFanSpeed(fan, **inputs):
+    """
+    Runs the exact skfuzzy inference for a single set of inputs.
+
+    Args:
+        fan (ctrl.ControlSystemSimulation): simulation returned by getFuzzyFan.
+        **inputs: crisp value of every antecedent, e.g. temp=50, load=30, tdp=100.
+
+    Returns:
+        float: fan speed in %, NaN if no rule fires for these inputs.
+    """
+    for label, value in inputs.items():
+        fan.input[label] = value
+    fan.compute()
+    return fan.output.get("fan_speed", np.nan)
+
+
+class CachedFuzzyFan:
+    """
+    Memoizing front of the skfuzzy simulation returned by getFuzzyFan.
+
+    Inputs are rounded to a multiple of their resolution and the output of every
+    rounded input set is kept in a bounded LRU cache, so a control loop that keeps
+    sending the same readings does no inference at all.
+
+    Attributes:
+        fan (ctrl.ControlSystemSimulation): simulation the outputs are computed with.
+        resolution (dict): rounding step of every input, inputs not in it are rounded to 1.
+    """
+
+    def __init__(self, fan, resolution=None, maxsize=CACHE_SIZE):
+        self.fan = fan
+        self.resolution = {**CACHE_RESOLUTION, **(resolution or {})}
+        self._cachedCompute = functools.lru_cache(maxsize=maxsize)(self._computeQuantized)
+
+    def _computeQuantized(self, key):
+        return computeFanSpeed(self.fan, **{label: index * self.resolution.get(label, 1) for label, index in key})
+
+    def compute(self, **inputs):
+        """
+        Returns the fan speed for the inputs rounded to the cache resolution.
+
+        Args:
+            **inputs: crisp value of every antecedent, e.g. temp=50, load=30, tdp=100.
+
+        Returns:
+            float: fan speed in %, NaN if no rule fires for these inputs.
+        """
+        key = tuple(sorted((label, round(value / self.resolution.get(label, 1))) for label, value in inputs.items()))
+        return self._cachedCompute(key)
+
+    @property
+    def hits(self):
+        """Amount of computations answered from the cache."""
+        return self._cachedCompute.cache_info().hits
+
+    @property
+    def misses(self):
+        """Amount of computations that had to run the inference."""
+        return self._cachedCompute.cache_info().misses
+
+    def clear(self):
+        """Empties the cache and resets its counters."""
+        self._cachedCompute.cache_clear()
+
+
+class CompiledFuzzyFan:
+    """
+    Lookup table version of the fuzzy fan controller, created by compileFuzzyFan.
+
+    The controller output is precomputed on a regular grid over all the inputs
+    and evaluated with multilinear (for three inputs trilinear) interpolation,
+    which takes microseconds instead of a full Mamdani inference.
+
+    Attributes:
+        labels (list): names of the inputs, in the order of the table axes.
+        axes (list): grid points of every input.
+        table (np.ndarray): controller output at every grid point, NaN where no rule fires.
+    """
+
+    def __init__(self, labels, axes, table):
+        self.labels = list(labels)
+        self.axes = [np.asarray(axis, dtype=float) for axis in axes]
+        self.table = np.ascontiguousarray(table, dtype=float)
+        self._steps = [axis[1] - axis[0] for axis in self.axes]
+        # flat python list and strides of the table, indexing it is much faster than numpy for single values
+        self._values = self.table.ravel().tolist()
+        self._strides = [stride // self.table.itemsize for stride in self.table.strides]
+        self._corners = [
+            (sum(upper * stride for upper, stride in zip(corner, self._strides)), corner)
+            for corner in itertools.product((0, 1), repeat=len(self.axes))
+        ]
+
+    def compute(self, **inputs):
+        """
+        Interpolates the fan speed for the given inputs.
+
+        Inputs outside of the table are clipped to its edges, like skfuzzy does.
+
+        Args:
+            **inputs: crisp value of every input, e.g. temp=50, load=30, tdp=100.
+
+        Returns:
+            float: fan speed in %, NaN if no rule fires at some corner of the grid cell around these inputs.
+        """
+        base = 0
+        weights = []
+        for label, axis, step, stride in zip(self.labels, self.axes, self._steps, self._strides):
+            value = min(max(inputs[label], axis[0]), axis[-1])
+            index = min(int((value - axis[0]) / step), len(axis) - 2)
+            base += index * stride
+            weights.append((value - axis[index]) / step)
+
+        # a NaN corner (no rule fires there) makes the result NaN, interpolating
+        # only the other corners is far off near the edge of the undefined region
+        result = 0.0
+        for offset, corner in self._corners:
+            weight = 1.0
+            for upper, t in zip(corner, weights):
+                weight *= t if upper else 1.0 - t
+            value = self._values[base + offset]
+            if value != value: # NaN
+                return np.nan
+            result += weight * value
+        return result
+
+    def errorReport(self, fan, samples=1000, seed=0):
+        """
+        Compares the table against the exact inference at random inputs.
+
+        Args:
+            fan (ctrl.ControlSystemSimulation): simulation the table was compiled from.
+            samples (int): amount of random input sets to compare.
+            seed (int): seed of the random inputs.
+
+        Returns:
+            dict: 'max_error' and 'mean_error' in fan speed %, over inputs where both
+                give a result, and 'mismatched' - amount of inputs where only one of them does.
+        """
+        rng = np.random.default_rng(seed)
+        errors = []
+        mismatched = 0
+        for _ in range(samples):
+            inputs = {label: rng.uniform(axis[0], axis[-1]) for label, axis in zip(self.labels, self.axes)}
+            exact = computeFanSpeed(fan, **inputs)
+            approx = self.compute(**inputs)
+            if np.isnan(exact) != np.isnan(approx):
+                mismatched += 1
+            elif not np.isnan(exact):
+                errors.append(abs(exact - approx))
+        return {
+            "max_error": float(max(errors, default=0.0)),
+            "mean_error": float(np.mean(errors)) if errors else 0.0,
+            "mismatched": mismatched,
+        }
+
+    def save(self, path):
+        """Saves the table to a .npz file, so it doesn't have to be compiled again."""
+        np.savez(path, labels=np.array(self.labels), table=self.table, *self.axes)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a table saved with save."""
+        data = np.load(path)
+        labels = [str(label) for label in data["labels"]]
+        return cls(labels, [data[f"arr_{i}"] for i in range(len(labels))], data["table"])
+
+
+def compileFuzzyFan(fan, steps=None):
+    """
+    Precomputes the controller returned by getFuzzyFan into a lookup table.
+
+    The grid is evaluated with computeFanSpeedBatch, use errorReport to see
+    how far the table is from the exact skfuzzy inference.
+
+    Args:
+        fan (ctrl.ControlSystemSimulation): simulation returned by getFuzzyFan.
+        steps (dict): grid spacing of every input, by default COMPILE_STEPS.
+
+    Returns:
+        CompiledFuzzyFan: the compiled controller.
+    """
+    steps = {**COMPILE_STEPS, **(steps or {})}
+    labels = [antecedent.label for antecedent in fan.ctrl.antecedents]
+    axes = []
+    for antecedent in fan.ctrl.antecedents:
+        low, high = antecedent.universe.min(), antecedent.universe.max()
+        axes.append(np.linspace(low, high, int(np.ceil((high - low) / steps[antecedent.label])) + 1))
+
+    grid = np.meshgrid(*axes, indexing="ij")
+    table = computeFanSpeedBatch(fan, **dict(zip(labels, grid)))
+    return CompiledFuzzyFan(labels, axes, table)
+
+
+def _firingStrength(antecedent, memberships, rule):
+    """
+    Evaluates a rule antecedent (a term or an AND / OR / NOT of terms) for arrays of inputs.
+
+    Args:
+        antecedent: Term or TermAggregate of the rule.
+        memberships (dict): membership arrays by (variable label, term label).
+        rule (ctrl.Rule): rule the antecedent belongs to, supplies the AND / OR functions.
+
+    Returns:
+        np.ndarray: firing strength for every sample.
+    """
+    if not isinstance(antecedent, TermAggregate):
+        return memberships[antecedent.parent.label, antecedent.label]
+
+    first = _firingStrength(antecedent.term1, memberships, rule)
+    if antecedent.kind == "not":
+        return 1.0 - first
+    second = _firingStrength(antecedent.term2, memberships, rule)
+    if antecedent.kind == "and":
+        return rule.and_func(first, second)
+    return rule.or_func(first, second)
+
+
+class AnalyticCentroid:
+    """
+    Exact centroid defuzzification for piecewise linear (triangular, trapezoidal) output sets.
+
+    Every output set is reduced to the polyline through its sampled membership
+    function. The aggregate of the sets clipped at their activation levels is
+    piecewise linear too, with breaks only at the polyline vertices, where two
+    polylines cross and where a polyline crosses an activation level. Its area
+    and moment are summed in closed form between those points, so the result
+    doesn't depend on how finely the output universe is sampled.
+
+    Attributes:
+        labels (list): labels of the output sets.
+        polylines (list): (x, y) vertices of every output set, in the order of labels.
+    """
+
+    def __init__(self, output):
+        self.labels = list(output.terms)
+        self.polylines = []
+        for term in output.terms.values():
+            x, y = output.universe.astype(float), term.mf.astype(float)
+            # drop samples lying on a straight line between their neighbours
+            bend = np.abs((y[2:] - y[1:-1]) * (x[1:-1] - x[:-2]) - (y[1:-1] - y[:-2]) * (x[2:] - x[1:-1])) > 1e-12
+            keep = np.concatenate(([True], bend, [True]))
+            self.polylines.append((x[keep], y[keep]))
+
+        segments = [
+            (x0, y0, x1, y1, k)
+            for k, (x, y) in enumerate(self.polylines)
+            for x0, y0, x1, y1 in zip(x[:-1], y[:-1], x[1:], y[1:])
+        ]
+        fixed = [x for x, _ in self.polylines]
+        for (ax0, ay0, ax1, ay1, a), (bx0, by0, bx1, by1, b) in itertools.combinations(segments, 2):
+            if a == b:
+                continue
+            slope_a, slope_b = (ay1 - ay0) / (ax1 - ax0), (by1 - by0) / (bx1 - bx0)
+            if slope_a != slope_b:
+                x = (by0 - ay0 + slope_a * ax0 - slope_b * bx0) / (slope_a - slope_b)
+                if max(ax0, bx0) <= x <= min(ax1, bx1):
+                    fixed.append([x])
+        self._fixed = np.unique(np.concatenate(fixed))
+
+        sloped = np.array([segment[:4] for segment in segments if segment[1] != segment[3]]).reshape(-1, 4)
+        self._x0, self._y0, self._x1, self._y1 = sloped.T
+
+    def centroid(self, levels):
+        """
+        Computes the centroid of the clipped and aggregated output sets.
+
+        Args:
+            levels (dict): activation level of every output set, arrays of the same length;
+                sets that are missing are not activated.
+
+        Returns:
+            np.ndarray: centroid for every sample, NaN where nothing is activated.
+        """
+        samples = len(next(iter(levels.values())))
+        clip = np.stack([np.broadcast_to(levels.get(label, 0.0), samples) for label in self.labels], axis=1)
+
+        # where every sloped segment reaches every activation level
+        t = (clip[:, None, :] - self._y0[None, :, None]) / (self._y1 - self._y0)[None, :, None]
+        crossings = np.where((t >= 0) & (t <= 1), self._x0[None, :, None] + t * (self._x1 - self._x0)[None, :, None], self._x0[None, :, None])
+        points = np.sort(np.concatenate([np.broadcast_to(self._fixed, (samples, len(self._fixed))), crossings.reshape(samples, -1)], axis=1), axis=1)
+
+        aggregate = np.zeros_like(points)
+        for k, (x, y) in enumerate(self.polylines):
+            np.maximum(aggregate, np.minimum(clip[:, k, None], np.interp(points, x, y)), out=aggregate)
+
+        dx = np.diff(points, axis=1)
+        left, right = aggregate[:, :-1], aggregate[:, 1:]
+        area = (dx * (left + right)).sum(axis=1) / 2
+        moment = (dx * (points[:, :-1] * (2 * left + right) + points[:, 1:] * (left + 2 * right))).sum(axis=1) / 6
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(area > 0, moment / area, np.nan)
+
+
+def computeFanSpeedBatch(fan, chunk_size=BATCH_CHUNK_SIZE, **inputs):
+    """
+    Vectorized version of computeFanSpeed for whole arrays of readings.
+
+    Memberships, rule firing and centroid defuzzification are done with NumPy
+    over all samples at once, following the rules of the simulation. The
+    centroid is computed exactly with AnalyticCentroid.
+
+    Args:
+        fan (ctrl.ControlSystemSimulation): simulation returned by getFuzzyFan.
+        chunk_size (int): amount of samples evaluated at once.
+        **inputs: arrays (or scalars) of every antecedent, broadcast against each other.
+
+    Returns:
+        np.ndarray: fan speed in % for every sample, NaN where no rule fires.
+    """
+    shape = np.broadcast(*inputs.values()).shape
+    inputs = {label: np.broadcast_to(np.asarray(values, dtype=float), shape).ravel() for label, values in inputs.items()}
+    antecedents = list(fan.ctrl.antecedents)
+    output = next(consequent for consequent in fan.ctrl.consequents if consequent.label == "fan_speed")
+    rules = list(fan.ctrl.rules)
+    defuzzifier = AnalyticCentroid(output)
+
+    result = np.empty(int(np.prod(shape)))
+    for start in range(0, len(result), chunk_size):
+        memberships = {}
+        for antecedent in antecedents:
+            values = inputs[antecedent.label][start:start + chunk_size]
+            for label, term in antecedent.terms.items():
+                memberships[antecedent.label, label] = np.interp(values, antecedent.universe, term.mf)
+
+        # how strongly every output set is activated
+        levels = {label: np.zeros(len(values)) for label in output.terms}
+        for rule in rules:
+            firing = _firingStrength(rule.antecedent, memberships, rule)
+            for consequent in rule.consequent:
+                if consequent.term.parent is output:
+                    label = consequent.term.label
+                    levels[label] = output.accumulation_method(levels[label], firing * consequent.weight)
+
+        result[start:start + chunk_size] = defuzzifier.centroid(levels)
+    return result.reshape(shape)
+
+def _isConjunction(antecedent):
+    """Tells whether a rule antecedent is a single term or only ANDs of terms."""
+    if not isinstance(antecedent, TermAggregate):
+        return True
+    return antecedent.kind == "and" and _isConjunction(antecedent.term1) and _isConjunction(antecedent.term2)
+
+
+class SparseFuzzyFan:
+    """
+    Fuzzy fan controller that only evaluates the rules that can fire.
+
+    For every input the universe is split into regions where the same terms are
+    non-zero, and every region stores a bitmask of the rules that can still fire
+    there. Rules that are only ANDs of terms can't fire when any of their terms
+    is zero, rules using OR / NOT are always evaluated. At compute time the
+    masks of the regions the inputs fall into are AND-ed together, so the cost
+    depends on the amount of rules that can fire rather than the size of the rule
+    base, and only the terms those rules use are fuzzified.
+
+    Attributes:
+        rules (list): rules of the simulation, bit i of the masks stands for rules[i].
+    """
+
+    def __init__(self, fan):
+        self.rules = list(fan.ctrl.rules)
+        self._antecedents = {antecedent.label: antecedent for antecedent in fan.ctrl.antecedents}
+        self._output = next(consequent for consequent in fan.ctrl.consequents if consequent.label == "fan_speed")
+        self._defuzzifier = AnalyticCentroid(self._output)
+
+        always = 0
+        terms_by_rule = []
+        for i, rule in enumerate(self.rules):
+            if _isConjunction(rule.antecedent):
+                terms_by_rule.append([(term.parent.label, term.label) for term in rule.antecedent_terms])
+            else:
+                terms_by_rule.append([])
+                always |= 1 << i
+
+        # per input: start of every region and the rules that can fire in it
+        self._regions = {}
+        for label, antecedent in self._antecedents.items():
+            universe = antecedent.universe
+            nonzero = {term_label: (term.mf[:-1] > 0) | (term.mf[1:] > 0) for term_label, term in antecedent.terms.items()}
+            starts, masks = [], []
+            for k in range(len(universe) - 1):
+                mask = always
+                for i, terms in enumerate(terms_by_rule):
+                    if terms and all(nonzero[term_label][k] for var, term_label in terms if var == label):
+                        mask |= 1 << i
+                if not masks or masks[-1] != mask:
+                    starts.append(universe[k])
+                    masks.append(mask)
+            self._regions[label] = (starts, masks)
+
+    def candidateRules(self, **inputs):
+        """
+        Returns the rules that can fire for the inputs.
+
+        Args:
+            **inputs: crisp value of every antecedent, e.g. temp=50, load=30, tdp=100.
+
+        Returns:
+            list: the rules worth evaluating.
+        """
+        mask = -1
+        for label, (starts, masks) in self._regions.items():
+            mask &= masks[max(bisect.bisect_right(starts, inputs[label]) - 1, 0)]
+
+        candidates = []
+        while mask:
+            lowest = mask & -mask
+            candidates.append(self.rules[lowest.bit_length() - 1])
+            mask ^= lowest
+        return candidates
+
+    def compute(self, **inputs):
+        """
+        Computes the fan speed evaluating only the rules that can fire.
+
+        Args:
+            **inputs: crisp value of every antecedent, e.g. temp=50, load=30, tdp=100.
+
+        Returns:
+            float: fan speed in %, NaN if no rule fires for these inputs.
+        """
+        memberships = {}
+        levels = {}
+        for rule in self.candidateRules(**inputs):
+            for term in rule.antecedent_terms:
+                key = (term.parent.label, term.label)
+                if key not in memberships:
+                    antecedent = self._antecedents[key[0]]
+                    memberships[key] = np.interp(inputs[key[0]], antecedent.universe, term.mf)
+            firing = _firingStrength(rule.antecedent, memberships, rule)
+            for consequent in rule.consequent:
+                if consequent.term.parent is self._output:
+                    label = consequent.term.label
+                    activation = firing * consequent.weight
+                    levels[label] = self._output.accumulation_method(levels[label], activation) if label in levels else activation
+
+        if not levels:
+            return np.nan
+        return float(self._defuzzifier.centroid({label: np.atleast_1d(level) for label, level in levels.items()})[0])
+
+
+def readLines(stream, follow=False):
+    """
+    Yields lines of a text stream, optionally waiting for new ones at its end like `tail -f`.
+
+    Args:
+        stream: text file object to read.
+        follow (bool): keep waiting for lines appended to the file instead of stopping at its end.
+    """
+    while True:
+        line = stream.readline()
+        if line:
+            yield line
+        elif follow:
+            time.sleep(0.1)
+        else:
+            return
+
+
+def runFanDaemon(lines, out, compute, threshold=DAEMON_THRESHOLD):
+    """
+    Headless fan control loop.
+
+    Every line holds the readings of DAEMON_INPUTS separated by spaces or commas,
+    lines with a wrong amount of values or non-finite ones (nan, inf) are skipped.
+    The fan speed is only computed again when some input moved by more than the
+    threshold since the last computation, otherwise the previous speed is repeated.
+    For every reading a line "<fan speed> <latency in us>" is written to out.
+
+    Args:
+        lines: iterable of sensor reading lines.
+        out: text file object the fan speeds are written to.
+        compute: function taking the readings as keyword arguments and returning the fan speed.
+        threshold (float): smallest input change that is worth computing again.
+
+    Returns:
+        dict: 'samples', 'computed' and the 'p50_us', 'p99_us', 'max_us' latencies.
+    """
+    last_inputs = None
+    fan_speed = np.nan
+    latencies = []
+    computed = 0
+    for line in lines:
+        try:
+            values = [float(value) for value in line.replace(",", " ").split()]
+        except ValueError:
+            values = []
+        # nan/inf would stick in last_inputs (no change ever exceeds the threshold) or crash the controller
+        if len(values) != len(DAEMON_INPUTS) or not all(np.isfinite(values)):
+            print("err: invalid reading:", line.strip(), file=sys.stderr)
+            continue
+
+        start = time.perf_counter()
+        if last_inputs is None or max(abs(a - b) for a, b in zip(values, last_inputs)) > threshold:
+            fan_speed = compute(**dict(zip(DAEMON_INPUTS, values)))
+            last_inputs = values
+            computed += 1
+        latency = (time.perf_counter() - start) * 1e6
+        latencies.append(latency)
+
+        out.write(f"{fan_speed:.2f} {latency:.1f}\n")
+        out.flush()
+
+    percentiles = np.percentile(latencies, [50, 99, 100]) if latencies else [0, 0, 0]
+    return {
+        "samples": len(latencies),
+        "computed": computed,
+        "p50_us": float(percentiles[0]),
+        "p99_us": float(percentiles[1]),
+        "max_us": float(percentiles[2]),
+    }
+
+
+def serveFanDaemon(port, compute, threshold=DAEMON_THRESHOLD):
+    """
+    Runs runFanDaemon for clients connecting to a local TCP port, one at a time.
+    Clients send lines of readings and get fan speed lines back.
+
+    Args:
+        port (int): port on localhost to listen on.
+        compute: function taking the readings as keyword arguments and returning the fan speed.
+        threshold (float): smallest input change that is worth computing again.
+    """
+    with socket.create_server(("127.0.0.1", port)) as server:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile("rw") as stream:
+                stats = runFanDaemon(readLines(stream), stream, compute, threshold)
+            print("stats:", stats, file=sys.stderr)
+
+
+def runGui(fan):
+    """
+    Fuzzy Fan Control System GUI Demonstrator.
+
+    This function implements an interactive graphical user interface (GUI) using the
+    Pygame library to visualize and test the 'getFuzzyFan' fuzzy logic controller.
+    The user can manipulate the input variables (temperature, load, and TDP) via
+    sliders, and the GUI dynamically displays the calculated fan speed output based
+    on the fuzzy inference system's rules. The fan speed is only computed again
+    when a slider moves.
+
+    Dependencies:
+        - Pygame
+        - pygame_widgets
+
+    Args:
+        fan (ctrl.ControlSystemSimulation): simulation returned by getFuzzyFan.
+    """
+    import pygame_widgets
+    import pygame
+    from pygame_widgets.slider import Slider
+    from pygame_widgets.textbox import TextBox
+
     pygame.init()
     pygame.font.init()  # you have to call this at the start,
     # if you want to use this module.
     my_font = pygame.font.SysFont("Comic Sans MS", 18)
     win = pygame.display.set_mode((1000, 600))
+    clock = pygame.time.Clock()
 
     text_surface_temp = my_font.render("temp", False, (0, 0, 0))
     text_surface_load = my_font.render("load", False, (0, 0, 0))
@@ -123,6 +680,7 @@ if __name__ == "__main__":
     output_fan = TextBox(win, 100, 200, 800, 27, fontSize=16)
     output_fan.disable()  
 
+    last_inputs = None
     run = True
     while run:
         events = pygame.event.get()
@@ -138,14 +696,17 @@ if __name__ == "__main__":
         output_temp.setText(str(slider_temp.getValue()))
         output_tdp.setText(str(slider_tdp.getValue()))
 
-        fan.input["temp"] = slider_temp.getValue()
-        fan.input["tdp"] = slider_tdp.getValue()
-        fan.input["load"] = slider_load.getValue()
-        fan.compute()
-        try:
-            output_fan.setText("Fan speed: " + str(fan.output["fan_speed"]))
-        except Exception as err:
-            print("err:",err)
+        inputs = (slider_temp.getValue(), slider_tdp.getValue(), slider_load.getValue())
+        if inputs != last_inputs:
+            last_inputs = inputs
+            fan.input["temp"] = slider_temp.getValue()
+            fan.input["tdp"] = slider_tdp.getValue()
+            fan.input["load"] = slider_load.getValue()
+            fan.compute()
+            try:
+                output_fan.setText("Fan speed: " + str(fan.output["fan_speed"]))
+            except Exception as err:
+                print("err:",err)
 
         win.blit(text_surface_load, (0, 0))
         win.blit(text_surface_temp, (0, 20))
@@ -153,3 +714,38 @@ if __name__ == "__main__":
 
         pygame_widgets.update(events)
         pygame.display.update()
+        clock.tick(60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fuzzy fan speed controller.")
+    parser.add_argument("--headless", action="store_true", help="read sensor readings instead of opening the GUI")
+    parser.add_argument("--input", default="-", help="file with lines of 'temp load tdp' readings, - for stdin")
+    parser.add_argument("--follow", action="store_true", help="keep waiting for readings appended to the input file")
+    parser.add_argument("--port", type=int, help="read readings from clients of this local TCP port instead")
+    parser.add_argument("--threshold", type=float, default=DAEMON_THRESHOLD, help="smallest input change that is computed again")
+    parser.add_argument("--cache", action="store_true", help="memoize outputs of inputs rounded to CACHE_RESOLUTION")
+    parser.add_argument("--sparse", action="store_true", help="only evaluate the rules that can fire")
+    parser.add_argument("--compiled", action="store_true", help="use the compiled lookup table instead of the exact inference")
+    args = parser.parse_args()
+
+    fan = getFuzzyFan()
+    if not args.headless:
+        runGui(fan)
+    else:
+        if args.compiled:
+            compute = compileFuzzyFan(fan).compute
+        elif args.cache:
+            compute = CachedFuzzyFan(fan).compute
+        elif args.sparse:
+            compute = SparseFuzzyFan(fan).compute
+        else:
+            compute = lambda **inputs: computeFanSpeed(fan, **inputs)
+
+        if args.port:
+            serveFanDaemon(args.port, compute, args.threshold)
+        elif args.input == "-":
+            print("stats:", runFanDaemon(readLines(sys.stdin, args.follow), sys.stdout, compute, args.threshold), file=sys.stderr)
+        else:
+            with open(args.input) as readings:
+                print("stats:", runFanDaemon(readLines(readings, args.follow), sys.stdout, compute, args.threshold), file=sys.stderr)
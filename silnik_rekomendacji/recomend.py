@@ -1,7 +1,30 @@
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
+from dataclasses import dataclass, replace
+from datetime import datetime
+from functools import partial
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from multiprocessing import shared_memory
+import os
+import shelve
+import shutil
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # by Kacper Pach s27112 & Dawid Frontczak s29608
 # rules & environment setup in readme (https://github.com/dawiffi/NAI_pjatk7sem/blob/main/silnik_rekomendacji/README.md)
@@ -9,29 +32,98 @@ import requests
 # --- Konfiguracja ---
 file_path = "formatted_data.csv"
 TARGET_USER = 'Dawid Frontczak'
-NUM_CLUSTERS = 3
+NUM_CLUSTERS = 3  # liczba klastrów albo "auto" (wybór najlepszej z K_CANDIDATES)
+K_CANDIDATES = range(2, 11)  # liczby klastrów sprawdzane przy automatycznym wyborze
+SELECTION_SAMPLE = 5000  # liczba użytkowników losowanych do liczenia silhouette
+SELECTION_WORKERS = os.cpu_count() or 1  # liczba procesów dopasowujących KMeans dla różnych k
+SELECTION_CACHE_PATH = "k_selection.json"  # zapamiętane wyniki wyboru k dla danej macierzy
 N_RECOMMENDATIONS = 5
+BATCH_SIZE = 1024  # rozmiar mini-batcha dla MiniBatchKMeans
+ARTIFACT_DIR = "model"  # katalog z zapisanymi wersjami modelu
+ARTIFACT_FORMAT = 4  # wersja formatu artefaktu, zmieniana przy niekompatybilnych zmianach
+CSV_CHUNK_SIZE = 100_000  # liczba wierszy CSV wczytywanych naraz
+CSV_CACHE_PATH = "formatted_data.npz"  # oczyszczone dane zapisane binarnie, używane zamiast CSV, dopóki ten się nie zmieni
+ENGINE = "cluster"  # silnik rekomendacji: "cluster" (średnie w klastrze), "item" (podobieństwo filmów) lub "als" (faktoryzacja)
+ITEM_NEIGHBOURS = 20  # liczba najbardziej podobnych filmów zapamiętywanych dla każdego filmu
+SIMILARITY_BLOCK = 1024  # liczba filmów, dla których podobieństwa liczone są naraz (ogranicza zużycie pamięci)
+ALS_FACTORS = 16  # liczba ukrytych cech użytkowników i filmów w faktoryzacji
+ALS_ITERATIONS = 10  # liczba naprzemiennych kroków (użytkownicy, filmy)
+ALS_REGULARIZATION = 0.1  # siła regularyzacji, mnożona przez liczbę ocen wiersza
+ALS_THREADS = 1  # liczba wątków rozwiązujących układy równań ALS
+ALS_BLOCK = 4096  # liczba wierszy rozwiązywanych naraz w jednym wątku
+BATCH_USERS = 4096  # liczba użytkowników liczonych naraz w trybie wsadowym (ogranicza zużycie pamięci)
+SERVER_HOST = "127.0.0.1"  # adres serwera rekomendacji
+SERVER_PORT = 8000  # port serwera rekomendacji
+SERVER_CACHE_SIZE = 10_000  # liczba zapamiętanych odpowiedzi serwera (najdawniej używane są usuwane)
+SERVER_RELOAD_INTERVAL = 2.0  # co ile sekund serwer sprawdza, czy w ARTIFACT_DIR/LATEST pojawiła się nowa wersja
+COLD_START_RECLUSTER_INTERVAL = 60.0  # co ile sekund serwer dopisuje oceny nowych użytkowników do modelu i go zapisuje
+KEEP_MODEL_VERSIONS = 5  # liczba najnowszych wersji modelu zostawianych na dysku po dopisaniu nowych użytkowników
+SERVER_MAX_RECOMMENDATIONS = 50  # największe n przyjmowane przez serwer (większe jest obcinane, żeby nie zapychać cache)
+SERVER_LATENCY_WINDOW = 1000  # liczba ostatnich zapytań, z których liczone są percentyle opóźnień
 
 # UZUPEŁNIJ SWÓJ KLUCZ API TMDB TUTAJ!
 TMDB_API_KEY = "YOUR_KEY" 
 BASE_URL = "https://api.themoviedb.org/3/"
+TMDB_LANGUAGE = 'pl-PL'
+TMDB_CONCURRENCY = 8  # maksymalna liczba równoległych zapytań do TMDB
+TMDB_RATE_LIMIT = 40  # maksymalna liczba zapytań na sekundę
+TMDB_RETRIES = 3  # liczba ponowień po błędzie połączenia, 429 lub 5xx (z rosnącym odstępem)
+TMDB_CACHE_PATH = "tmdb_cache"  # plik z zapamiętanymi odpowiedziami TMDB
 # --------------------
 
-def fetch_movie_details(title):
+class TokenBucket:
+    """
+    Ogranicznik liczby zapytań (token bucket): `rate` żetonów na sekundę, najwyżej `capacity` naraz.
+    Bezpieczny dla wątków.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Czeka, aż będzie dostępny żeton, i go zabiera."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def make_tmdb_session(concurrency=TMDB_CONCURRENCY):
+    """Sesja HTTP z pulą połączeń na `concurrency` wątków i ponawianiem zapytań z rosnącym odstępem."""
+    session = requests.Session()
+    retry = Retry(total=TMDB_RETRIES, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def fetch_movie_details(title, session=None, language=TMDB_LANGUAGE, base_url=BASE_URL, rate_limiter=None):
     """
     Wyszukuje film/serial po tytule w TMDB i zwraca podstawowe szczegóły.
     Wymaga zainstalowania biblioteki 'requests' i ważnego klucza TMDB_API_KEY.
+    Opcjonalnie korzysta ze wspólnej sesji (puli połączeń) i ogranicznika zapytań.
     """
     try:
         # Używamy endpointu multi, by znaleźć i filmy, i seriale
-        search_url = f"{BASE_URL}search/multi"
+        search_url = f"{base_url}search/multi"
         params = {
             'api_key': TMDB_API_KEY,
             'query': title,
-            'language': 'pl-PL'
+            'language': language
         }
         
-        response = requests.get(search_url, params=params, timeout=5)
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        response = (session or requests).get(search_url, params=params, timeout=5)
         response.raise_for_status()
         
         results = response.json().get('results')
@@ -40,7 +132,8 @@ def fetch_movie_details(title):
             best_match = results[0]
             
             # Weryfikacja typu treści
-            media_type = best_match.get('media_type')
+            media_type = best_match.get('media_type') or ''
+            main_title, release_date = None, None
             
             if media_type == 'movie':
                 main_title = best_match.get('title')
@@ -61,91 +154,758 @@ def fetch_movie_details(title):
     except requests.exceptions.RequestException as e:
         return {'Tytuł': title, 'Opis (Skrót)': f"Błąd API: {e}", 'Rok wydania': 'N/A', 'Typ': 'Błąd'}
 
-def load_and_transform_data(file_path):
+def fetch_many_movie_details(titles, language=TMDB_LANGUAGE, base_url=BASE_URL, cache_path=TMDB_CACHE_PATH, concurrency=TMDB_CONCURRENCY):
+    """
+    Pobiera szczegóły wielu tytułów naraz: najpierw z trwałego cache na dysku (klucz: adres API, tytuł i język,
+    więc odpowiedzi zastępczego serwera testowego nie mieszają się z prawdziwymi),
+    brakujące równolegle z TMDB przez wspólną sesję, z ograniczeniem liczby zapytań na sekundę.
+    Błędy API nie są zapamiętywane. Zwraca listę szczegółów w kolejności tytułów.
+    """
+    results = {}
+    with shelve.open(cache_path) as cache:
+        missing = []
+        for title in dict.fromkeys(titles):
+            key = json.dumps([base_url, title, language])
+            if key in cache:
+                results[title] = cache[key]
+            else:
+                missing.append(title)
+
+        if missing:
+            rate_limiter = TokenBucket(TMDB_RATE_LIMIT, TMDB_RATE_LIMIT)
+            with make_tmdb_session(concurrency) as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+                fetched = executor.map(lambda title: fetch_movie_details(title, session, language, base_url, rate_limiter), missing)
+                for title, details in zip(missing, fetched):
+                    results[title] = details
+                    if details is None or details['Typ'] != 'Błąd':
+                        cache[json.dumps([base_url, title, language])] = details
+    return [results[title] for title in titles]
+
+def _encode(values, categories):
+    """Zamienia wartości na kody kategorii, dopisując nowe wartości na koniec kategorii."""
+    codes = categories.get_indexer(values)
+    unknown = codes == -1
+    if unknown.any():
+        categories = categories.append(pd.Index(pd.unique(values[unknown])))
+        codes[unknown] = categories.get_indexer(values[unknown])
+    return codes.astype(np.int32), categories
+
+def load_and_transform_data(file_path, chunksize=CSV_CHUNK_SIZE, cache_path=None):
     """
     Wczytuje dane z formatu długiego (UserID, MovieID, Rating) z nagłówkiem.
     Czyści dane, zapewniając poprawne typy kolumn.
+    Plik jest czytany porcjami z jawnymi typami, niepoprawne wiersze są usuwane w każdej porcji,
+    a ID od razu zamieniane na kody kategorii. Jeśli podano cache_path, oczyszczone dane są zapisywane
+    do pliku .npz i używane ponownie, dopóki plik CSV się nie zmieni.
+    Zwraca DataFrame z kategorycznymi UserID i MovieID oraz ocenami float32.
     """
+    source = os.stat(file_path)
+    signature = np.array([source.st_size, source.st_mtime_ns])
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached['signature'], signature):
+                return pd.DataFrame({
+                    'UserID': pd.Categorical.from_codes(cached['user_codes'], cached['users']),
+                    'MovieID': pd.Categorical.from_codes(cached['movie_codes'], cached['movies']),
+                    'Rating': cached['ratings'],
+                })
 
-    data = pd.read_csv(file_path)
-    
-    # Konwersja ocen na float, z obsługą błędów (coercing)
-    data['Rating'] = pd.to_numeric(data['Rating'], errors='coerce')
-    
-    # Usunięcie wierszy z brakującymi lub niepoprawnymi wartościami
-    data_final = data.dropna(subset=['UserID', 'MovieID', 'Rating'])
-    
-    # Finalna konwersja typów: ID na string, Oceny na float
-    data_final['UserID'] = data_final['UserID'].astype(str)
-    data_final['MovieID'] = data_final['MovieID'].astype(str)
-    
-    return data_final
+    users, movies = pd.Index([], dtype=object), pd.Index([], dtype=object)
+    user_codes, movie_codes, ratings = [], [], []
+    chunks = pd.read_csv(file_path, chunksize=chunksize, dtype={'UserID': str, 'MovieID': str, 'Rating': str})
+    for chunk in chunks:
+        # Konwersja ocen na float, z obsługą błędów (coercing)
+        chunk['Rating'] = pd.to_numeric(chunk['Rating'], errors='coerce')
+
+        # Usunięcie wierszy z brakującymi lub niepoprawnymi wartościami
+        chunk = chunk.dropna(subset=['UserID', 'MovieID', 'Rating'])
+
+        codes, users = _encode(chunk['UserID'].to_numpy(), users)
+        user_codes.append(codes)
+        codes, movies = _encode(chunk['MovieID'].to_numpy(), movies)
+        movie_codes.append(codes)
+        ratings.append(chunk['Rating'].to_numpy(dtype=np.float32))
+
+    user_codes = np.concatenate(user_codes) if user_codes else np.zeros(0, dtype=np.int32)
+    movie_codes = np.concatenate(movie_codes) if movie_codes else np.zeros(0, dtype=np.int32)
+    ratings = np.concatenate(ratings) if ratings else np.zeros(0, dtype=np.float32)
+
+    if cache_path:
+        np.savez(
+            cache_path, signature=signature, user_codes=user_codes, movie_codes=movie_codes, ratings=ratings,
+            users=users.to_numpy(dtype=str), movies=movies.to_numpy(dtype=str)
+        )
+
+    # Finalne typy: ID jako kategorie (napisy), Oceny jako float
+    return pd.DataFrame({
+        'UserID': pd.Categorical.from_codes(user_codes, users),
+        'MovieID': pd.Categorical.from_codes(movie_codes, movies),
+        'Rating': ratings,
+    })
+
+@dataclass
+class RecommenderModel:
+    """
+    Rzadka macierz ocen (użytkownicy × filmy) razem z dopasowanym skalerem i klasteryzacją.
+    Brak oceny to zero w macierzy. Klasteryzacja korzysta z pierwszych `scaler.n_features_in_`
+    kolumn - filmy dodane później trafiają do rekomendacji, ale nie do cech klastrów.
+    """
+    ratings: sparse.csr_matrix
+    users: pd.Index
+    movies: pd.Index
+    scaler: StandardScaler
+    kmeans: MiniBatchKMeans
+    clusters: np.ndarray
+    cluster_means: np.ndarray  # średnia ocena każdego filmu w każdym klastrze (klastry × filmy)
+    ranking: np.ndarray  # indeksy filmów w każdym klastrze posortowane od najwyższej średniej
+    similarity: sparse.csr_matrix  # top-k podobieństw kosinusowych każdego filmu (filmy × filmy)
+    user_factors: np.ndarray  # ukryte cechy użytkowników z ALS (użytkownicy × ALS_FACTORS)
+    item_factors: np.ndarray  # ukryte cechy filmów z ALS (filmy × ALS_FACTORS)
+    rating_mean: float  # średnia wszystkich ocen, od której liczone są odchylenia w ALS
+
+def build_rating_matrix(data, users=None, movies=None):
+    """
+    Buduje rzadką macierz CSR z danych w formacie długim (UserID, MovieID, Rating).
+    Powtórzone oceny tej samej pary są uśredniane, tak jak w pivot_table.
+    Zwraca macierz oraz indeksy użytkowników i filmów (wierszy i kolumn).
+    """
+    user_ids = pd.Categorical(data['UserID'], categories=users)
+    movie_ids = pd.Categorical(data['MovieID'], categories=movies)
+    pairs = pd.DataFrame({'user': user_ids.codes, 'movie': movie_ids.codes, 'rating': data['Rating'].to_numpy()})
+    pairs = pairs.groupby(['user', 'movie'], sort=False)['rating'].mean().reset_index()
+
+    ratings = sparse.csr_matrix(
+        (pairs['rating'].to_numpy(dtype=np.float32), (pairs['user'], pairs['movie'])),
+        shape=(len(user_ids.categories), len(movie_ids.categories))
+    )
+    ratings.eliminate_zeros()
+    return ratings, pd.Index(user_ids.categories), pd.Index(movie_ids.categories)
+
+def compute_cluster_means(ratings, clusters, n_clusters):
+    """Średnie oceny filmów w każdym klastrze (brak oceny liczy się jako 0), jako gęsta macierz klastry × filmy."""
+    membership = sparse.csr_matrix(
+        (np.ones(len(clusters), dtype=np.float32), (clusters, np.arange(len(clusters)))),
+        shape=(n_clusters, len(clusters))
+    )
+    sizes = np.maximum(np.bincount(clusters, minlength=n_clusters), 1)
+    return np.asarray((membership @ ratings).todense(), dtype=np.float32) / sizes[:, None]
+
+def build_ranking_index(cluster_means):
+    """
+    Dla każdego klastra sortuje filmy malejąco po średniej ocenie (raz na klasteryzację),
+    żeby rekomendacje wymagały tylko przejścia po początku (lub końcu) listy.
+    """
+    return np.argsort(-cluster_means, axis=1, kind='stable').astype(np.int32)
+
+def _similarity_blocks(ratings, columns, block_size=SIMILARITY_BLOCK):
+    """
+    Podobieństwa kosinusowe wybranych filmów (columns) do wszystkich filmów, blokami po block_size filmów.
+    Zwraca kolejne pary (indeksy filmów bloku, gęsta macierz ich podobieństw bez podobieństwa filmu do siebie).
+    """
+    norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0)).ravel())
+    normalized = sparse.csc_matrix(ratings @ sparse.diags(1 / np.maximum(norms, 1e-12)), dtype=np.float32)
+    for start in range(0, len(columns), block_size):
+        block_columns = columns[start:start + block_size]
+        block = (normalized[:, block_columns].T @ normalized).toarray()
+        block[np.arange(len(block)), block_columns] = 0
+        yield block_columns, block
+
+def _top_k_matrix(rows, cols, values, k, n_movies):
+    """Z listy podobieństw (wiersz, kolumna, wartość) zostawia k największych dodatnich w każdym wierszu, jako CSR."""
+    positive = values > 0
+    rows, cols, values = rows[positive], cols[positive], values[positive]
+    order = np.lexsort((-values, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = rank < k
+    return sparse.csr_matrix((values[keep], (rows[keep], cols[keep])), shape=(n_movies, n_movies), dtype=np.float32)
+
+def build_item_similarity(ratings, k=ITEM_NEIGHBOURS, block_size=SIMILARITY_BLOCK):
+    """
+    Liczy podobieństwo kosinusowe filmów (kolumn macierzy ocen) i zostawia dla każdego filmu
+    tylko k najbardziej podobnych (dodatnio) innych filmów.
+    Podobieństwa liczone są blokami po block_size filmów, więc w pamięci jest naraz
+    najwyżej block_size × liczba filmów wartości. Zwraca rzadką macierz CSR filmy × filmy.
+    """
+    n_movies = ratings.shape[1]
+    k = min(k, max(n_movies - 1, 0))
+    if k == 0:
+        return sparse.csr_matrix((n_movies, n_movies), dtype=np.float32)
+
+    rows, cols, values = [], [], []
+    for block_columns, block in _similarity_blocks(ratings, np.arange(n_movies), block_size):
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        rows.append(np.repeat(block_columns, k))
+        cols.append(top.ravel())
+        values.append(np.take_along_axis(block, top, axis=1).ravel())
+    return _top_k_matrix(np.concatenate(rows), np.concatenate(cols), np.concatenate(values), k, n_movies)
+
+def _positive_similarities(ratings, columns, block_size=SIMILARITY_BLOCK):
+    """Wszystkie dodatnie podobieństwa filmów `columns` do pozostałych filmów jako tablice (wiersz, kolumna, wartość)."""
+    rows, cols, values = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+    for block_columns, block in _similarity_blocks(ratings, columns, block_size):
+        block_rows, block_cols = np.nonzero(block > 0)
+        rows.append(block_columns[block_rows])
+        cols.append(block_cols)
+        values.append(block[block_rows, block_cols])
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+def update_item_similarity(similarity, ratings, movies, k=ITEM_NEIGHBOURS, block_size=SIMILARITY_BLOCK):
+    """
+    Aktualizuje indeks podobieństw po zmianie ocen filmów `movies` (indeksy kolumn) bez liczenia wszystkich par.
+    Podobieństwo zmienia się tylko w parach ze zmienionym filmem, więc wiersze zmienionych filmów są liczone
+    od nowa, a w pozostałych wierszach podmieniane są podobieństwa do zmienionych filmów. Wiersz, w którym
+    zmieniony sąsiad z pełnego top-k stał się mniej podobny, też jest liczony od nowa, bo jego miejsce może
+    zająć film spoza indeksu. Wynik jest taki sam jak z build_item_similarity (z dokładnością do remisów).
+    """
+    n_movies = ratings.shape[1]
+    k = min(k, max(n_movies - 1, 0))
+    movies = np.unique(movies)
+    similarity = similarity.tocsr(copy=True)
+    similarity.resize((n_movies, n_movies))
+    if k == 0 or len(movies) == 0:
+        return similarity
+
+    changed = np.zeros(n_movies, dtype=bool)
+    changed[movies] = True
+    changed_rows, changed_cols, changed_values = _positive_similarities(ratings, movies, block_size)
+    fresh = sparse.csr_matrix((changed_values, (changed_rows, changed_cols)), shape=(n_movies, n_movies))
+
+    # pozostałe wiersze z pełnym top-k, w których któryś zmieniony sąsiad stracił na podobieństwie
+    old = similarity.tocoo()
+    neighbour = ~changed[old.row] & changed[old.col]
+    new_values = np.asarray(fresh[old.col[neighbour], old.row[neighbour]]).ravel()
+    full = np.diff(similarity.indptr)[old.row[neighbour]] >= k
+    affected = np.unique(old.row[neighbour][full & (new_values < old.data[neighbour])])
+    recomputed = changed.copy()
+    recomputed[affected] = True
+    affected_rows, affected_cols, affected_values = _positive_similarities(ratings, affected, block_size)
+
+    kept = ~recomputed[old.row] & ~changed[old.col]
+    # podobieństwo jest symetryczne: wiersz zmienionego filmu daje kandydatów do wierszy pozostałych filmów
+    mirrored = ~recomputed[changed_cols]
+    return _top_k_matrix(
+        np.concatenate([old.row[kept], changed_rows, changed_cols[mirrored], affected_rows]),
+        np.concatenate([old.col[kept], changed_cols, changed_rows[mirrored], affected_cols]),
+        np.concatenate([old.data[kept], changed_values, changed_values[mirrored], affected_values]),
+        k, n_movies
+    )
+
+def _als_step(ratings, fixed, regularization, threads=ALS_THREADS, block_size=ALS_BLOCK):
+    """
+    Jeden krok ALS: przy ustalonych cechach `fixed` (kolumny macierzy ocen) wyznacza cechy każdego wiersza,
+    rozwiązując regularyzowany układ równań tylko na jego zaobserwowanych ocenach.
+    Macierze Grama wszystkich wierszy powstają jednym iloczynem rzadkiej macierzy ocenionych pozycji
+    z iloczynami zewnętrznymi cech (pamięć rośnie z liczbą ocen, nie z użytkownicy × filmy),
+    a bloki wierszy są rozwiązywane wsadowo (np.linalg.solve), opcjonalnie w wielu wątkach.
+    """
+    n_factors = fixed.shape[1]
+    outer = np.einsum('if,ig->ifg', fixed, fixed).reshape(len(fixed), n_factors * n_factors)
+    rated = ratings.copy()
+    rated.data = np.ones_like(rated.data)
+    counts = np.diff(ratings.indptr)
+
+    def solve(start):
+        stop = min(start + block_size, ratings.shape[0])
+        gram = np.asarray(rated[start:stop] @ outer).reshape(-1, n_factors, n_factors)
+        gram += (regularization * np.maximum(counts[start:stop], 1))[:, None, None] * np.eye(n_factors)
+        target = np.asarray(ratings[start:stop] @ fixed)
+        return np.linalg.solve(gram, target[:, :, None])[:, :, 0]
+
+    blocks = range(0, ratings.shape[0], block_size)
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            solved = list(executor.map(solve, blocks))
+    else:
+        solved = [solve(start) for start in blocks]
+    if not solved:
+        return np.zeros((0, n_factors), dtype=np.float32)
+    return np.concatenate(solved).astype(np.float32)
+
+def train_als(ratings, n_factors=ALS_FACTORS, iterations=ALS_ITERATIONS, regularization=ALS_REGULARIZATION, threads=ALS_THREADS):
+    """
+    Faktoryzacja macierzy ocen metodą naprzemiennych najmniejszych kwadratów (ALS).
+    Uczy się tylko na zaobserwowanych ocenach (odchyleniach od średniej) - brak oceny nie jest traktowany jak zero.
+    Zwraca cechy użytkowników, cechy filmów i średnią ocen; przewidywana ocena to średnia + iloczyn skalarny cech.
+    """
+    rating_mean = float(ratings.data.mean()) if ratings.nnz else 0.0
+    residuals = ratings.astype(np.float64)
+    residuals.data -= rating_mean
+    residuals_by_movie = residuals.T.tocsr()
+
+    rng = np.random.default_rng(0)
+    item_factors = rng.normal(scale=0.1, size=(ratings.shape[1], n_factors))
+    user_factors = np.zeros((ratings.shape[0], n_factors), dtype=np.float32)
+    for _ in range(iterations):
+        user_factors = _als_step(residuals, item_factors, regularization, threads)
+        item_factors = _als_step(residuals_by_movie, user_factors, regularization, threads)
+    return user_factors, item_factors.astype(np.float32), rating_mean
+
+def _share_array(array):
+    """Kopiuje tablicę do nowego bloku pamięci współdzielonej. Zwraca blok i opis (nazwa, kształt, typ) dla procesów."""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+def _evaluate_k(n_clusters, features, shape, sample_size):
+    """
+    Dopasowuje MiniBatchKMeans dla jednej liczby klastrów na skalowanej macierzy z pamięci współdzielonej
+    (bez kopiowania jej do procesu) i zwraca inercję, silhouette na próbce użytkowników i czas w sekundach.
+    """
+    start = time.perf_counter()
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in features]
+    try:
+        data, indices, indptr = (
+            np.ndarray(array_shape, dtype=dtype, buffer=block.buf)
+            for block, (_, array_shape, dtype) in zip(blocks, features)
+        )
+        matrix = sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=BATCH_SIZE, n_init=3, random_state=0)
+        labels = kmeans.fit_predict(matrix)
+        if len(np.unique(labels)) > 1:
+            silhouette = float(silhouette_score(matrix, labels, sample_size=min(sample_size, shape[0]), random_state=0))
+        else:
+            silhouette = -1.0
+        inertia = float(kmeans.inertia_)
+        del data, indices, indptr, matrix
+    finally:
+        for block in blocks:
+            block.close()
+    return {"inertia": inertia, "silhouette": silhouette, "seconds": time.perf_counter() - start}
+
+def select_num_clusters(ratings, candidates=K_CANDIDATES, workers=SELECTION_WORKERS, cache_path=SELECTION_CACHE_PATH, sample_size=SELECTION_SAMPLE):
+    """
+    Wybiera liczbę klastrów: dopasowuje KMeans dla każdego k z candidates równolegle w procesach,
+    które czytają jedną skalowaną macierz z pamięci współdzielonej, i wybiera k z najwyższym silhouette.
+    Wyniki są zapamiętywane w cache_path (klucz: skrót macierzy i ustawień), więc ponowny wybór
+    dla tych samych danych liczy tylko nowe k. Zwraca najlepsze k i wyniki dla wszystkich k.
+    """
+    features = StandardScaler(with_mean=False).fit_transform(ratings).tocsr().astype(np.float32)
+    candidates = [k for k in candidates if 2 <= k < features.shape[0]]
+    if not candidates:
+        raise ValueError("Za mało użytkowników, żeby wybrać liczbę klastrów")
+
+    digest = hashlib.sha1()
+    for array in (features.data, features.indices, features.indptr):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(json.dumps([features.shape, BATCH_SIZE, sample_size]).encode())
+    key = digest.hexdigest()
+
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, encoding="utf-8") as cache_file:
+            cache = json.load(cache_file)
+    results = {int(k): result for k, result in cache.get(key, {}).items()}
+
+    missing = [k for k in candidates if k not in results]
+    if missing:
+        shared = [_share_array(array) for array in (features.data, features.indices, features.indptr)]
+        try:
+            descriptions = [description for _, description in shared]
+            with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+                evaluate = partial(_evaluate_k, features=descriptions, shape=features.shape, sample_size=sample_size)
+                results.update(zip(missing, executor.map(evaluate, missing)))
+        finally:
+            for block, _ in shared:
+                block.close()
+                block.unlink()
+
+        if cache_path:
+            cache[key] = {str(k): result for k, result in sorted(results.items())}
+            with open(cache_path + ".tmp", "w", encoding="utf-8") as cache_file:
+                json.dump(cache, cache_file)
+            os.replace(cache_path + ".tmp", cache_path)
+
+    results = {k: results[k] for k in candidates}
+    best = max(results, key=lambda k: results[k]["silhouette"])
+    return best, results
+
+def print_k_selection(best, results):
+    """Wyświetla wyniki wyboru liczby klastrów z czasem dopasowania każdego k."""
+    print(f"{'k':>4}{'inercja':>14}{'silhouette':>12}{'czas [s]':>10}")
+    for k, result in results.items():
+        marker = "  <- wybrane" if k == best else ""
+        print(f"{k:>4}{result['inertia']:>14.1f}{result['silhouette']:>12.4f}{result['seconds']:>10.2f}{marker}")
+
+def train_model(data, n_clusters=NUM_CLUSTERS):
+    """
+    Skaluje rzadką macierz ocen (bez centrowania, żeby nie stała się gęsta)
+    i dzieli użytkowników na klastry za pomocą MiniBatchKMeans.
+    Dla n_clusters="auto" liczba klastrów jest wybierana przez select_num_clusters.
+    """
+    ratings, users, movies = build_rating_matrix(data)
+    if n_clusters == "auto":
+        n_clusters, results = select_num_clusters(ratings)
+        print_k_selection(n_clusters, results)
+    scaler = StandardScaler(with_mean=False)
+    user_features_scaled = scaler.fit_transform(ratings)
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=BATCH_SIZE, n_init=3)
+    clusters = kmeans.fit_predict(user_features_scaled)
+    cluster_means = compute_cluster_means(ratings, clusters, n_clusters)
+    return RecommenderModel(
+        ratings, users, movies, scaler, kmeans, clusters, cluster_means,
+        build_ranking_index(cluster_means), build_item_similarity(ratings), *train_als(ratings)
+    )
+
+def add_ratings(model, new_data):
+    """
+    Dopisuje nowe oceny do modelu bez przebudowy całej macierzy.
+    Nowi użytkownicy i filmy są dokładani na koniec indeksów, istniejące oceny nadpisywane.
+    Klastry są douczane (partial_fit) tylko na zmienionych wierszach, a ich użytkownicy
+    dostają nowe przypisania. Indeks podobieństw filmów jest aktualizowany tylko dla filmów z nowymi ocenami.
+    """
+    new_users = pd.Index(new_data['UserID'].astype(str).unique()).difference(model.users)
+    new_movies = pd.Index(new_data['MovieID'].astype(str).unique()).difference(model.movies)
+    users = model.users.append(new_users)
+    movies = model.movies.append(new_movies)
+
+    new_data = new_data.assign(UserID=new_data['UserID'].astype(str), MovieID=new_data['MovieID'].astype(str))
+    update, _, _ = build_rating_matrix(new_data, users, movies)
+    ratings = model.ratings.copy()
+    ratings.resize(update.shape)
+    # nadpisanie: zerujemy stare wartości tam, gdzie przyszły nowe oceny
+    written = update.copy()
+    written.data[:] = 1
+    ratings = (ratings - ratings.multiply(written) + update).tocsr()
+    ratings.eliminate_zeros()
+
+    touched = np.unique(update.nonzero()[0])
+    n_features = model.scaler.n_features_in_
+    new_rows = touched[touched >= len(model.users)]
+    if len(new_rows):
+        model.scaler.partial_fit(ratings[new_rows, :n_features])
+    touched_features = model.scaler.transform(ratings[touched, :n_features])
+    model.kmeans.partial_fit(touched_features)
+
+    clusters = np.resize(model.clusters, len(users))
+    clusters[touched] = model.kmeans.predict(touched_features)
+
+    model.ratings, model.users, model.movies, model.clusters = ratings, users, movies, clusters
+    model.cluster_means = compute_cluster_means(ratings, clusters, model.kmeans.n_clusters)
+    model.ranking = build_ranking_index(model.cluster_means)
+    model.similarity = update_item_similarity(model.similarity, ratings, update.nonzero()[1])
+
+    # ALS: nowe filmy dostają zerowe cechy (przewidywana ocena = średnia), a cechy zmienionych
+    # użytkowników są wyliczane od nowa przy ustalonych cechach filmów; pełna faktoryzacja przy train
+    item_factors = np.zeros((len(movies), model.item_factors.shape[1]), dtype=np.float32)
+    item_factors[:len(model.item_factors)] = model.item_factors
+    user_factors = np.zeros((len(users), item_factors.shape[1]), dtype=np.float32)
+    user_factors[:len(model.user_factors)] = model.user_factors
+    residuals = ratings[touched].astype(np.float64)
+    residuals.data -= model.rating_mean
+    user_factors[touched] = _als_step(residuals, item_factors, ALS_REGULARIZATION)
+    model.user_factors, model.item_factors = user_factors, item_factors
+    return model
+
+def save_model(model, artifact_dir=ARTIFACT_DIR):
+    """
+    Zapisuje model jako nową wersję artefaktu w katalogu artifact_dir/<wersja>.
+    Tablice są zapisywane jako .npy, żeby dało się je mapować w pamięci,
+    a plik LATEST jest podmieniany atomowo dopiero po zapisaniu całej wersji.
+    Zwraca ścieżkę zapisanej wersji.
+    """
+    # mikrosekundy w nazwie, a przy kolizji kolejny numer - dwa zapisy nigdy nie trafią do tego samego katalogu
+    base_version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    os.makedirs(artifact_dir, exist_ok=True)
+    attempt = 0
+    while True:
+        version = base_version if attempt == 0 else f"{base_version}-{attempt}"
+        path = os.path.join(artifact_dir, version)
+        try:
+            os.makedirs(path)
+            break
+        except FileExistsError:
+            attempt += 1
+
+    np.save(os.path.join(path, "users.npy"), model.users.to_numpy(dtype=str))
+    np.save(os.path.join(path, "movies.npy"), model.movies.to_numpy(dtype=str))
+    np.save(os.path.join(path, "clusters.npy"), model.clusters.astype(np.int32))
+    np.save(os.path.join(path, "cluster_means.npy"), model.cluster_means.astype(np.float32))
+    np.save(os.path.join(path, "ranking.npy"), model.ranking)
+    np.save(os.path.join(path, "ratings_data.npy"), model.ratings.data)
+    np.save(os.path.join(path, "ratings_indices.npy"), model.ratings.indices)
+    np.save(os.path.join(path, "ratings_indptr.npy"), model.ratings.indptr)
+    np.save(os.path.join(path, "similarity_data.npy"), model.similarity.data)
+    np.save(os.path.join(path, "similarity_indices.npy"), model.similarity.indices)
+    np.save(os.path.join(path, "similarity_indptr.npy"), model.similarity.indptr)
+    np.save(os.path.join(path, "user_factors.npy"), model.user_factors)
+    np.save(os.path.join(path, "item_factors.npy"), model.item_factors)
+    joblib.dump(model.scaler, os.path.join(path, "scaler.joblib"))
+    joblib.dump(model.kmeans, os.path.join(path, "kmeans.joblib"))
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as meta:
+        json.dump({
+            "format": ARTIFACT_FORMAT, "version": version, "n_clusters": int(model.kmeans.n_clusters),
+            "rating_mean": model.rating_mean
+        }, meta)
+
+    latest = os.path.join(artifact_dir, "LATEST")
+    with open(latest + ".tmp", "w", encoding="utf-8") as pointer:
+        pointer.write(version)
+    os.replace(latest + ".tmp", latest)
+    return path
+
+def _latest_version(artifact_dir=ARTIFACT_DIR):
+    """Wersja modelu wskazana w pliku LATEST."""
+    with open(os.path.join(artifact_dir, "LATEST"), encoding="utf-8") as pointer:
+        return pointer.read().strip()
+
+def prune_models(artifact_dir=ARTIFACT_DIR, keep=KEEP_MODEL_VERSIONS):
+    """
+    Usuwa najstarsze wersje modelu, zostawiając `keep` najnowszych i zawsze tę wskazaną w LATEST.
+    Zwraca listę usuniętych wersji.
+    """
+    latest = _latest_version(artifact_dir)
+    versions = sorted(
+        name for name in os.listdir(artifact_dir)
+        if os.path.isdir(os.path.join(artifact_dir, name)) and name != latest
+    )
+    removed = versions[:max(len(versions) - max(keep - 1, 0), 0)]
+    for version in removed:
+        shutil.rmtree(os.path.join(artifact_dir, version), ignore_errors=True)
+    return removed
+
+def load_model(artifact_dir=ARTIFACT_DIR, version=None):
+    """
+    Wczytuje zapisaną wersję modelu (domyślnie tę wskazaną w LATEST).
+    Tablice ocen i średnich są mapowane w pamięci (mmap), więc start nie zależy od ich rozmiaru.
+    """
+    if version is None:
+        version = _latest_version(artifact_dir)
+    path = os.path.join(artifact_dir, version)
+
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as meta:
+        metadata = json.load(meta)
+    if metadata["format"] != ARTIFACT_FORMAT:
+        raise ValueError(f"Nieobsługiwany format artefaktu w {path}")
 
-def get_recommendations(user_id, matrix, n=5):
+    def load_array(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+    users = pd.Index(load_array("users"))
+    movies = pd.Index(load_array("movies"))
+    ratings = sparse.csr_matrix(
+        (load_array("ratings_data"), load_array("ratings_indices"), load_array("ratings_indptr")),
+        shape=(len(users), len(movies)), copy=False
+    )
+    similarity = sparse.csr_matrix(
+        (load_array("similarity_data"), load_array("similarity_indices"), load_array("similarity_indptr")),
+        shape=(len(movies), len(movies)), copy=False
+    )
+    return RecommenderModel(
+        ratings, users, movies,
+        joblib.load(os.path.join(path, "scaler.joblib")),
+        joblib.load(os.path.join(path, "kmeans.joblib")),
+        load_array("clusters"),
+        load_array("cluster_means"),
+        load_array("ranking"),
+        similarity,
+        load_array("user_factors"),
+        load_array("item_factors"),
+        metadata["rating_mean"],
+    )
+
+def get_recommendations(user_id, model, n=5):
     """Generuje top N rekomendacji i antyrekomendacji na podstawie średnich ocen w klastrze."""
-    if user_id not in matrix.index:
+    if user_id not in model.users:
         return ["Brak użytkownika w macierzy"], ["Brak użytkownika w macierzy"]
 
-    target_cluster = matrix.loc[user_id, 'Cluster']
-    cluster_data = matrix[matrix['Cluster'] == target_cluster].drop(columns=['Cluster'])
+    row = model.users.get_loc(user_id)
+    return _cluster_recommendations(model, model.clusters[row], model.ratings[row].indices, n)
 
-    # Filmy nieoglądane przez użytkownika
-    user_ratings = matrix.loc[user_id].drop('Cluster', errors='ignore')
-    unseen_movies = user_ratings[user_ratings == 0].index.tolist()
-    
-    if not unseen_movies:
+def _cluster_recommendations(model, cluster, seen, n):
+    """Top N i bottom N filmów z rankingu klastra z pominięciem obejrzanych (indeksy kolumn w seen)."""
+    ranking = model.ranking[cluster]
+
+    if len(seen) >= len(model.movies):
         return ["Brak nieoglądanych filmów"], ["Brak nieoglądanych filmów"]
 
-    # Obliczanie średniej oceny dla nieoglądanych filmów w klastrze
-    cluster_means = cluster_data[unseen_movies].mean()
-    
+    # Wystarczy n + liczba obejrzanych pozycji z początku (końca) rankingu klastra,
+    # żeby po pominięciu obejrzanych zostało n filmów
+    head = ranking[:n + len(seen)]
+    tail = ranking[::-1][:n + len(seen)]
+
     # Rekomendacje: Top N z najwyższą średnią
-    # ascending=False (od najwyższej do najniższej)
-    recommendation_series = cluster_means.sort_values(ascending=False)
-    top_recommendations = recommendation_series.head(n).index.tolist()
-    
+    top_recommendations = model.movies[head[~np.isin(head, seen)][:n]].tolist()
+
     # Antyrekomendacje: Top N z najniższą średnią
-    # ascending=True (od najniższej do najwyższej)
-    antirecommendation_series = cluster_means.sort_values(ascending=True)
-    top_antirecommendations = antirecommendation_series.head(n).index.tolist()
-            
+    top_antirecommendations = model.movies[tail[~np.isin(tail, seen)][:n]].tolist()
+
     return top_recommendations, top_antirecommendations
 
-def main():
-    """Główna funkcja uruchamiająca silnik rekomendacji."""
-    print("--- 1. Wczytywanie i Klasteryzacja Danych ---")
-    data_final = load_and_transform_data(file_path)
+def get_item_recommendations(user_id, model, n=5):
+    """
+    Generuje top N rekomendacji i antyrekomendacji na podstawie podobieństwa filmów (item-item):
+    przewidywana ocena nieobejrzanego filmu to średnia ocen użytkownika ważona podobieństwem
+    obejrzanych filmów do niego. Brane są pod uwagę tylko filmy podobne do któregoś z obejrzanych.
+    """
+    if user_id not in model.users:
+        return ["Brak użytkownika w macierzy"], ["Brak użytkownika w macierzy"]
 
-    user_movie_matrix = data_final.pivot_table(
-        index='UserID',
-        columns='MovieID',
-        values='Rating'
-    ).fillna(0)
+    row = model.ratings[model.users.get_loc(user_id)]
+    neighbours = model.similarity[row.indices]
+    weights = np.asarray(neighbours.sum(axis=0)).ravel()
+    scores = np.asarray(row.data @ neighbours).ravel()
 
-    scaler = StandardScaler()
-    user_features_scaled = scaler.fit_transform(user_movie_matrix)
+    weights[row.indices] = 0
+    candidates = np.flatnonzero(weights)
+    if len(candidates) == 0:
+        return ["Brak nieoglądanych filmów"], ["Brak nieoglądanych filmów"]
 
-    kmeans = KMeans(n_clusters=NUM_CLUSTERS)
-    user_movie_matrix['Cluster'] = kmeans.fit_predict(user_features_scaled)
-    
+    predicted = scores[candidates] / weights[candidates]
+    order = np.argsort(-predicted, kind='stable')
+
+    # Rekomendacje: Top N z najwyższą przewidywaną oceną
+    top_recommendations = model.movies[candidates[order[:n]]].tolist()
+
+    # Antyrekomendacje: Top N z najniższą przewidywaną oceną
+    top_antirecommendations = model.movies[candidates[order[::-1][:n]]].tolist()
+
+    return top_recommendations, top_antirecommendations
+
+def get_factor_recommendations(user_id, model, n=5):
+    """
+    Generuje top N rekomendacji i antyrekomendacji z faktoryzacji ALS:
+    przewidywana ocena każdego filmu to iloczyn skalarny cech użytkownika i filmu.
+    """
+    if user_id not in model.users:
+        return ["Brak użytkownika w macierzy"], ["Brak użytkownika w macierzy"]
+
+    row = model.users.get_loc(user_id)
+    seen = model.ratings[row].indices
+    if len(seen) >= len(model.movies):
+        return ["Brak nieoglądanych filmów"], ["Brak nieoglądanych filmów"]
+
+    scores = model.item_factors @ model.user_factors[row]
+    scores[seen] = np.nan
+    unseen = len(model.movies) - len(seen)
+    order = np.argsort(-scores, kind='stable')[:unseen]  # NaN (obejrzane) trafiają na koniec
+
+    # Rekomendacje: Top N z najwyższą przewidywaną oceną
+    top_recommendations = model.movies[order[:n]].tolist()
+
+    # Antyrekomendacje: Top N z najniższą przewidywaną oceną
+    top_antirecommendations = model.movies[order[::-1][:n]].tolist()
+
+    return top_recommendations, top_antirecommendations
+
+def _valid_ratings(ratings):
+    """Oceny (tytuł -> ocena) zamienione na liczby, bez niepoprawnych wartości."""
+    valid = {}
+    for title, rating in ratings.items():
+        try:
+            rating = float(rating)
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(rating):
+            valid[str(title)] = rating
+    return valid
+
+def rating_row(ratings, model):
+    """
+    Zamienia oceny nowego użytkownika (słownik tytuł -> ocena) na wiersz macierzy ocen modelu (1 × filmy).
+    Tytuły spoza modelu i niepoprawne oceny są pomijane.
+    """
+    ratings = _valid_ratings(ratings)
+    columns = model.movies.get_indexer(list(ratings))
+    known = columns != -1
+    return sparse.csr_matrix(
+        (np.fromiter(ratings.values(), dtype=np.float32, count=len(ratings))[known], (np.zeros(known.sum(), dtype=np.int32), columns[known])),
+        shape=(1, len(model.movies))
+    )
+
+def assign_cluster(row, model):
+    """
+    Skaluje wiersz ocen zapisanym skalerem i zwraca najbliższy centroid KMeans (bez douczania modelu).
+    Liczone bezpośrednio w NumPy, bez walidacji scaler.transform/kmeans.predict, która dla jednego wiersza dominuje czas.
+    """
+    features = row[:, :model.scaler.n_features_in_].toarray()[0] / model.scaler.scale_
+    return int(np.argmin(((model.kmeans.cluster_centers_ - features) ** 2).sum(axis=1)))
+
+def cold_start_recommendations(ratings, model, n=5):
+    """
+    Szybka ścieżka dla użytkownika spoza macierzy: kilka jego ocen (słownik tytuł -> ocena) jest skalowanych
+    zapisanym skalerem, użytkownik trafia do najbliższego istniejącego klastra i dostaje rekomendacje
+    z rankingu tego klastra od razu, bez ponownego trenowania.
+    """
+    row = rating_row(ratings, model)
+    if row.nnz == 0:
+        return ["Brak ocen znanych filmów"], ["Brak ocen znanych filmów"]
+    return _cluster_recommendations(model, assign_cluster(row, model), row.indices, n)
+
+RECOMMENDERS = {
+    "cluster": get_recommendations,
+    "item": get_item_recommendations,
+    "als": get_factor_recommendations,
+}
+
+def _top_columns(scores, n):
+    """Indeksy n największych wartości w każdym wierszu, posortowane malejąco (argpartition zamiast pełnego sortowania)."""
+    n = min(n, scores.shape[1])
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(top, order, axis=1)
+
+def batch_recommendations(model, user_ids=None, n=N_RECOMMENDATIONS, chunk_size=BATCH_USERS):
+    """
+    Rekomendacje i antyrekomendacje dla wszystkich (lub podanych) użytkowników naraz.
+    Dla każdej paczki użytkowników bierze wiersze średnich ich klastrów, maskuje obejrzane filmy
+    i wybiera skrajne wartości wektorowo. Zwraca tabelę w formacie długim:
+    UserID, Rank, Recommendation, Antirecommendation (None, gdy zabrakło nieoglądanych filmów).
+    """
+    if user_ids is None:
+        rows = np.arange(len(model.users))
+    else:
+        rows = model.users.get_indexer(pd.Index(user_ids))
+        for user_id in pd.Index(user_ids)[rows == -1]:
+            print(f"Pominięto: Użytkownik '{user_id}' nie istnieje w danych.")
+        rows = rows[rows != -1]
+
+    movies = model.movies.to_numpy(dtype=object)
+    n = min(n, len(movies))
+    frames = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        scores = np.asarray(model.cluster_means)[np.asarray(model.clusters)[chunk]]
+        seen = model.ratings[chunk].toarray() != 0
+
+        best = np.where(seen, -np.inf, scores)
+        worst = np.where(seen, -np.inf, -scores)
+        top = _top_columns(best, n)
+        bottom = _top_columns(worst, n)
+
+        recommendations = np.where(np.isfinite(np.take_along_axis(best, top, axis=1)), movies[top], None)
+        antirecommendations = np.where(np.isfinite(np.take_along_axis(worst, bottom, axis=1)), movies[bottom], None)
+        frames.append(pd.DataFrame({
+            'UserID': np.repeat(model.users.to_numpy(dtype=object)[chunk], n),
+            'Rank': np.tile(np.arange(1, n + 1), len(chunk)),
+            'Recommendation': recommendations.ravel(),
+            'Antirecommendation': antirecommendations.ravel(),
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=['UserID', 'Rank', 'Recommendation', 'Antirecommendation'])
+    return pd.concat(frames, ignore_index=True)
+
+def show_recommendations(model, user_id, engine=ENGINE):
+    """Wyświetla klaster użytkownika oraz jego rekomendacje i antyrekomendacje ze szczegółami z TMDB."""
     # Weryfikacja, czy użytkownik istnieje
-    if TARGET_USER not in user_movie_matrix.index:
-        print(f"Błąd: Użytkownik '{TARGET_USER}' nie istnieje w danych.")
+    if user_id not in model.users:
+        print(f"Błąd: Użytkownik '{user_id}' nie istnieje w danych.")
         return
 
-    target_cluster = user_movie_matrix.loc[TARGET_USER, 'Cluster']
+    target_cluster = model.clusters[model.users.get_loc(user_id)]
     
-    print(f"Użytkownik '{TARGET_USER}' należy do klastra: {target_cluster}")
-    print(f"Liczba filmów/seriali: {user_movie_matrix.shape[1] - 1}")
+    print(f"Użytkownik '{user_id}' należy do klastra: {target_cluster}")
+    print(f"Liczba filmów/seriali: {len(model.movies)}")
     
     # 2. Generowanie rekomendacji i antyrekomendacji
-    recommendations, antirecommendations = get_recommendations(TARGET_USER, user_movie_matrix, N_RECOMMENDATIONS)
+    recommendations, antirecommendations = RECOMMENDERS[engine](user_id, model, N_RECOMMENDATIONS)
 
     # 3. Wyświetlanie wyników z użyciem API
     print(f"\n==============================================")
-    print(f"⭐️ TOP {N_RECOMMENDATIONS} REKOMENDACJI dla {TARGET_USER}:")
-    for i, title in enumerate(recommendations):
-        details = fetch_movie_details(title)
+    print(f"⭐️ TOP {N_RECOMMENDATIONS} REKOMENDACJI dla {user_id}:")
+    for i, (title, details) in enumerate(zip(recommendations, fetch_many_movie_details(recommendations))):
         if details:
             print(f"--- {i+1}. {details['Tytuł']} ({details['Rok wydania']} | {details['Typ']}) ---")
             print(f"   Opis: {details['Opis (Skrót)']}")
@@ -157,5 +917,327 @@ def main():
         print(f"{i+1}. {movie}")
     print(f"==============================================")
 
+class RecommendationService:
+    """
+    Trzyma wczytany model w pamięci i odpowiada na zapytania o rekomendacje z cache wyników (LRU).
+    Model razem ze swoim cache jest podmieniany jednym przypisaniem, więc zapytania w trakcie
+    przeładowania dostają odpowiedź ze starego albo nowego modelu, nigdy z ich mieszanki.
+    Nowi użytkownicy dostają rekomendacje od razu (cold_start_recommendations), a ich oceny
+    są okresowo dopisywane do modelu (recluster). Zbiera liczniki zapytań, trafień w cache,
+    przeładowań i opóźnień. Bezpieczny dla wątków.
+    """
+
+    def __init__(self, artifact_dir=ARTIFACT_DIR, cache_size=SERVER_CACHE_SIZE):
+        self.artifact_dir = artifact_dir
+        self.cache_size = cache_size
+        self._state = None  # (wersja, model, cache)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._started = time.monotonic()
+        self._latencies = deque(maxlen=SERVER_LATENCY_WINDOW)
+        self._pending = {}  # oceny nowych użytkowników czekające na dopisanie do modelu
+        self._counters = {
+            "requests": 0, "cache_hits": 0, "unknown_users": 0, "cold_starts": 0,
+            "reloads": 0, "reload_errors": 0, "reclusters": 0, "recluster_errors": 0,
+        }
+        self.reload()
+
+    def reload(self):
+        """Wczytuje wersję z LATEST, jeśli różni się od obecnej. Zwraca True, gdy model został podmieniony."""
+        with self._reload_lock:
+            version = _latest_version(self.artifact_dir)
+            if self._state is not None and self._state[0] == version:
+                return False
+            model = load_model(self.artifact_dir, version)
+            self._state = (version, model, OrderedDict())
+            with self._lock:
+                self._counters["reloads"] += 1
+            return True
+
+    def recluster(self, artifact_dir=None):
+        """
+        Dopisuje oceny oczekujących nowych użytkowników do kopii modelu (add_ratings douczą klastry),
+        zapisuje ją jako nową wersję artefaktu i podmienia obecny model. Zwraca liczbę dopisanych użytkowników.
+        Oczekujące oceny są usuwane dopiero po podmianie modelu, więc w trakcie douczania użytkownicy
+        nadal dostają rekomendacje, a po błędzie zostają do następnej próby.
+        """
+        with self._reload_lock:
+            with self._lock:
+                pending = {user_id: dict(ratings) for user_id, ratings in self._pending.items()}
+            if not pending:
+                return 0
+            _, model, _ = self._state
+            new_data = pd.DataFrame(
+                [(user_id, movie, rating) for user_id, ratings in pending.items() for movie, rating in ratings.items()],
+                columns=['UserID', 'MovieID', 'Rating']
+            )
+            # add_ratings douczą skaler i klastry w miejscu, więc pracuje na ich kopiach
+            model = add_ratings(replace(model, scaler=copy.deepcopy(model.scaler), kmeans=copy.deepcopy(model.kmeans)), new_data)
+            artifact_dir = artifact_dir or self.artifact_dir
+            version = os.path.basename(save_model(model, artifact_dir))
+            with self._lock:
+                self._state = (version, model, OrderedDict())
+                # oceny dodane w trakcie douczania zostają do następnego recluster
+                for user_id, ratings in pending.items():
+                    remaining = {
+                        movie: rating for movie, rating in self._pending[user_id].items()
+                        if ratings.get(movie) != rating
+                    }
+                    if remaining:
+                        self._pending[user_id] = remaining
+                    else:
+                        del self._pending[user_id]
+                self._counters["reclusters"] += 1
+            # każde dopisanie zapisuje pełną wersję, stare są usuwane dopiero po przełączeniu LATEST
+            prune_models(artifact_dir)
+            return len(pending)
+
+    def recluster_periodically(self, interval=COLD_START_RECLUSTER_INTERVAL, stop=None):
+        """Co interval sekund wywołuje recluster, jeśli są nowi użytkownicy (do uruchomienia w osobnym wątku)."""
+        stop = stop or threading.Event()
+        while not stop.wait(interval):
+            try:
+                absorbed = self.recluster()
+            except Exception as e:
+                # dowolny błąd douczania nie może zatrzymać wątku, bo kolejka nowych użytkowników rosłaby bez końca
+                # oceny zostają w kolejce i trafią do modelu przy następnej próbie
+                with self._lock:
+                    self._counters["recluster_errors"] += 1
+                print(f"Nie udało się dopisać nowych użytkowników: {e}")
+                continue
+            if absorbed:
+                print(f"Dopisano {absorbed} nowych użytkowników, model: {self._state[0]}")
+
+    def add_user(self, user_id, ratings, n=N_RECOMMENDATIONS):
+        """
+        Przyjmuje oceny nowego użytkownika (słownik tytuł -> ocena) i od razu zwraca jego rekomendacje
+        z najbliższego klastra. Oceny czekają na dopisanie do modelu przy najbliższym recluster.
+        Użytkownik bez żadnej oceny znanego filmu nie jest zapamiętywany (known = False).
+        """
+        start = time.perf_counter()
+        version, model, cache = self._state
+        row = rating_row(ratings, model)
+        if row.nnz == 0:
+            return {
+                "user": user_id, "version": version, "engine": "cluster", "known": False, "cluster": None,
+                "recommendations": ["Brak ocen znanych filmów"], "antirecommendations": ["Brak ocen znanych filmów"],
+            }
+        cluster = assign_cluster(row, model)
+        recommendations, antirecommendations = _cluster_recommendations(model, cluster, row.indices, n)
+        # tylko tytuły z modelu - nieznane nie mogą trafić do katalogu filmów przy recluster
+        known_ratings = {title: rating for title, rating in _valid_ratings(ratings).items() if title in model.movies}
+        with self._lock:
+            self._pending.setdefault(user_id, {}).update(known_ratings)
+            self._counters["cold_starts"] += 1
+            self._latencies.append(time.perf_counter() - start)
+            # wcześniejsze odpowiedzi dla tego użytkownika są już nieaktualne
+            for key in [key for key in cache if key[0] == user_id]:
+                del cache[key]
+        return {
+            "user": user_id, "version": version, "engine": "cluster", "known": True, "cluster": cluster,
+            "recommendations": recommendations, "antirecommendations": antirecommendations,
+        }
+
+    def watch(self, interval=SERVER_RELOAD_INTERVAL, stop=None):
+        """Co interval sekund sprawdza, czy pojawiła się nowa wersja modelu (do uruchomienia w osobnym wątku)."""
+        stop = stop or threading.Event()
+        while not stop.wait(interval):
+            try:
+                if self.reload():
+                    print(f"Przeładowano model: {self._state[0]}")
+            except (OSError, ValueError) as e:
+                # niedokończony lub uszkodzony artefakt: zostajemy przy obecnym modelu
+                with self._lock:
+                    self._counters["reload_errors"] += 1
+                print(f"Nie udało się przeładować modelu: {e}")
+
+    def recommend(self, user_id, engine=ENGINE, n=N_RECOMMENDATIONS):
+        """Rekomendacje i antyrekomendacje dla użytkownika, z cache. Zwraca słownik gotowy do zapisania jako JSON."""
+        start = time.perf_counter()
+        version, model, cache = self._state
+        key = (user_id, engine, n)
+        with self._lock:
+            result = cache.get(key)
+            if result is not None:
+                cache.move_to_end(key)
+        hit = result is not None
+
+        if not hit:
+            known = user_id in model.users
+            with self._lock:
+                pending = self._pending.get(user_id)
+            used_engine = engine
+            if not known and pending:
+                # nowy użytkownik, którego oceny nie są jeszcze w modelu - zawsze najbliższy klaster
+                known = True
+                used_engine = "cluster"
+                recommendations, antirecommendations = cold_start_recommendations(pending, model, n)
+            else:
+                recommendations, antirecommendations = RECOMMENDERS[engine](user_id, model, n)
+            result = {
+                "user": user_id, "version": version, "engine": used_engine, "known": known,
+                "recommendations": recommendations, "antirecommendations": antirecommendations,
+            }
+            with self._lock:
+                cache[key] = result
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+
+        with self._lock:
+            self._counters["requests"] += 1
+            self._counters["cache_hits"] += hit
+            self._counters["unknown_users"] += not result["known"]
+            self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        """Liczniki serwera: zapytania, trafienia w cache, przepustowość i percentyle opóźnień (ms)."""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = np.array(self._latencies)
+        uptime = time.monotonic() - self._started
+        counters.update({
+            "version": self._state[0],
+            "uptime_s": round(uptime, 3),
+            "requests_per_s": round(counters["requests"] / uptime, 3) if uptime else 0.0,
+        })
+        if len(latencies):
+            p50, p90, p99 = np.percentile(latencies * 1000, [50, 90, 99]).tolist()
+            counters.update({"latency_ms_p50": round(p50, 4), "latency_ms_p90": round(p90, 4), "latency_ms_p99": round(p99, 4)})
+        return counters
+
+def make_request_handler(service):
+    """
+    Klasa obsługi HTTP dla serwera rekomendacji:
+    GET /recommend?user=<ID>[&engine=cluster|item|als][&n=5] (n od 1 do SERVER_MAX_RECOMMENDATIONS), GET /stats, GET /health
+    oraz POST /users z {"user": ID, "ratings": {tytuł: ocena}} dla nowych użytkowników.
+    Odpowiedzi są w formacie JSON.
+    """
+    class RecommendationHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if urlparse(self.path).path != "/users":
+                return self._send(404, {"error": "nieznana ścieżka"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                user_id, ratings = str(body["user"]), dict(body["ratings"])
+            except (ValueError, KeyError, TypeError):
+                return self._send(400, {"error": 'oczekiwano {"user": ID, "ratings": {tytuł: ocena}}'})
+            result = service.add_user(user_id, ratings)
+            return self._send(200 if result["known"] else 422, result)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path == "/recommend":
+                engine = query.get("engine", ENGINE)
+                if "user" not in query:
+                    return self._send(400, {"error": "brak parametru user"})
+                if engine not in RECOMMENDERS:
+                    return self._send(400, {"error": f"nieznany silnik: {engine}"})
+                try:
+                    n = int(query.get("n", N_RECOMMENDATIONS))
+                except ValueError:
+                    return self._send(400, {"error": "n musi być liczbą"})
+                if n < 1:
+                    return self._send(400, {"error": "n musi być dodatnie"})
+                n = min(n, SERVER_MAX_RECOMMENDATIONS)
+                result = service.recommend(query["user"], engine, n)
+                return self._send(200 if result["known"] else 404, result)
+            if url.path == "/stats":
+                return self._send(200, service.stats())
+            if url.path == "/health":
+                return self._send(200, {"status": "ok", "version": service.stats()["version"]})
+            return self._send(404, {"error": "nieznana ścieżka"})
+
+        def _send(self, status, body):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            # bez logowania każdego zapytania, liczniki są w /stats
+            pass
+
+    return RecommendationHandler
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, artifact_dir=ARTIFACT_DIR):
+    """
+    Uruchamia lokalny serwer HTTP z rekomendacjami z zapisanego modelu.
+    Model jest wczytywany raz, a nowa wersja (zmiana ARTIFACT_DIR/LATEST) jest podmieniana bez restartu.
+    Oceny nowych użytkowników są dopisywane do modelu co COLD_START_RECLUSTER_INTERVAL sekund.
+    """
+    service = RecommendationService(artifact_dir)
+    threading.Thread(target=service.watch, daemon=True).start()
+    threading.Thread(target=service.recluster_periodically, daemon=True).start()
+    with ThreadingHTTPServer((host, port), make_request_handler(service)) as server:
+        print(f"Serwer rekomendacji (model {service.stats()['version']}) na http://{host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+def main():
+    """Główna funkcja uruchamiająca silnik rekomendacji."""
+    parser = argparse.ArgumentParser(description="Silnik rekomendacji filmów.")
+    commands = parser.add_subparsers(dest="command")
+    train_parser = commands.add_parser("train", help="trenuje model i zapisuje go jako nową wersję artefaktu")
+    train_parser.add_argument("--clusters", default=NUM_CLUSTERS, type=lambda value: value if value == "auto" else int(value),
+                              help='liczba klastrów albo "auto"')
+    serve_parser = commands.add_parser("serve", help="lokalny serwer HTTP z rekomendacjami z zapisanego modelu")
+    serve_parser.add_argument("--host", default=SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    commands.add_parser("select", help="wybiera liczbę klastrów spośród K_CANDIDATES i wyświetla wyniki dla każdego k")
+    recommend_parser = commands.add_parser("recommend", help="rekomendacje z zapisanego modelu, bez trenowania")
+    recommend_parser.add_argument("--user", default=TARGET_USER)
+    recommend_parser.add_argument("--engine", choices=RECOMMENDERS, default=ENGINE, help="silnik rekomendacji")
+    recommend_parser.add_argument("--rating", action="append", metavar="TYTUŁ=OCENA",
+                                  help="oceny nowego użytkownika spoza macierzy (można podać wiele razy)")
+    batch_parser = commands.add_parser("batch", help="rekomendacje dla wszystkich użytkowników z zapisanego modelu, zapisywane do pliku Parquet")
+    batch_parser.add_argument("--output", default="recommendations.parquet")
+    batch_parser.add_argument("--user", action="append", help="tylko dla tych użytkowników (można podać wiele razy)")
+    args = parser.parse_args()
+
+    if args.command == "batch":
+        start = time.perf_counter()
+        results = batch_recommendations(load_model(), args.user, N_RECOMMENDATIONS)
+        results.to_parquet(args.output, index=False)
+        print(f"Zapisano {results['UserID'].nunique()} użytkowników do {args.output} w {time.perf_counter() - start:.2f} s")
+        return
+
+    if args.command == "serve":
+        serve(args.host, args.port)
+        return
+
+    if args.command == "recommend":
+        model = load_model()
+        if args.rating:
+            ratings = dict(rating.rsplit("=", 1) for rating in args.rating)
+            row = rating_row(ratings, model)
+            if row.nnz == 0:
+                print("Błąd: żaden z ocenionych tytułów nie występuje w danych.")
+                return
+            recommendations, antirecommendations = cold_start_recommendations(ratings, model, N_RECOMMENDATIONS)
+            print(f"Nowy użytkownik, najbliższy klaster: {assign_cluster(row, model)}")
+            print("Rekomendacje:", ", ".join(recommendations))
+            print("Antyrekomendacje:", ", ".join(antirecommendations))
+            return
+        show_recommendations(model, args.user, args.engine)
+        return
+
+    print("--- 1. Wczytywanie i Klasteryzacja Danych ---")
+    data_final = load_and_transform_data(file_path, cache_path=CSV_CACHE_PATH)
+    if args.command == "select":
+        print_k_selection(*select_num_clusters(build_rating_matrix(data_final)[0]))
+        return
+    model = train_model(data_final, args.clusters if args.command == "train" else NUM_CLUSTERS)
+
+    if args.command == "train":
+        print(f"Zapisano model: {save_model(model)}")
+        return
+    show_recommendations(model, TARGET_USER)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()